@@ -0,0 +1,52 @@
+"""Compare writing a column with a field width pre-pass to reformatting on overflow
+
+Run with ``python benchmarks/field_width.py``, requires numpy.
+"""
+
+import timeit
+
+import numpy as np
+
+from cchdo.params import WHPNames
+from cchdo.params.arrays import required_width
+
+PARAM = WHPNames["CTDPRS [DBAR]"]
+ROWS = 100_000
+
+
+def reformat_on_overflow(values):
+    """Format with the default width, then reformat everything if any value was too wide"""
+    formatter = PARAM.formatter()
+    cells = [formatter(value) for value in values]
+    width = max(len(cell) for cell in cells)
+    if width > PARAM.field_width:
+        formatter = PARAM.formatter(field_width_override=width)
+        cells = [formatter(value) for value in values]
+    return cells
+
+
+def pre_pass(values):
+    """Compute the width first, then format everything once"""
+    formatter = PARAM.formatter(field_width_override=required_width(PARAM, values))
+    return [formatter(value) for value in values]
+
+
+def main():
+    rng = np.random.default_rng(0)
+    fits = rng.uniform(0, 6000, ROWS)
+    overflows = fits.copy()
+    overflows[-1] = 123456789.0
+
+    for label, values in (("fits", fits), ("overflows", overflows)):
+        assert reformat_on_overflow(values) == pre_pass(values)
+        for func in (reformat_on_overflow, pre_pass):
+            seconds = min(timeit.repeat(lambda: func(values), number=1, repeat=5))
+            print(f"{label:10} {func.__name__:22} {seconds * 1000:8.1f} ms")
+        seconds = min(
+            timeit.repeat(lambda: required_width(PARAM, values), number=1, repeat=5)
+        )
+        print(f"{label:10} {'required_width only':22} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,28 @@
-from collections import UserDict
-from dataclasses import asdict
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterator, Mapping
+from dataclasses import asdict, fields
 from functools import cached_property
 from importlib.metadata import PackageNotFoundError, version
 from importlib.resources import files
-from json import loads
+from json import dumps, loads
 from logging import getLogger
-from typing import Literal, NamedTuple, overload
+from textwrap import indent
+from typing import IO, Literal, NamedTuple, get_args, overload
 
 from ._cf_names import cf_standard_names as _cf_standard_names
+from ._search import Completion, SearchHit, complete, search
 from ._whp_names import _aliases
 from ._whp_names import whp_names as _whp_names
 from .core import CFStandardName, WHPName
 
-__all__ = ["CFStandardNames", "WHPNames"]
+__all__ = [
+    "CFStandardNames",
+    "WHPNames",
+    "Completion",
+    "SearchHit",
+    "complete",
+    "search",
+]
 
 try:
     __version__ = version("cchdo.params")
@@ -129,6 +139,55 @@ def flag_name(name: str) -> tuple[str, bool]:
     return name, False
 
 
+_LEGACY_JSON_DROP = (
+    "nc_name",
+    "rank",
+    "analytical_temperature_name",
+    "analytical_temperature_units",
+    "radiation_wavelength",
+    "scattering_angle",
+    "excitation_wavelength",
+    "emission_wavelength",
+    "nc_group",
+    "in_erddap",
+    "alt_depth",
+    "flag_col",
+    "error_col",
+)
+_LEGACY_JSON_REQUIRED = {"whp_name", "whp_unit", "flag_w", "data_type", "field_width"}
+
+
+def _legacy_json_record(param: WHPName) -> dict:
+    """Convert a single WHPName into its record in the old json database format"""
+    p_dict = asdict(param)
+    p_dict["data_type"] = p_dict.pop("dtype")
+
+    # cleanup things
+    for key in _LEGACY_JSON_DROP:
+        del p_dict[key]
+
+    if p_dict["data_type"] == "string":
+        del p_dict["numeric_min"]
+        del p_dict["numeric_max"]
+        del p_dict["numeric_precision"]
+
+    if p_dict["flag_w"] == "no_flags":
+        p_dict["flag_w"] = None
+
+    return {
+        k: v for k, v in p_dict.items() if v is not None or k in _LEGACY_JSON_REQUIRED
+    }
+
+
+_WHPNAME_FIELDS = frozenset(field.name for field in fields(WHPName))
+_COLUMN_FIELDS = tuple(
+    field
+    for field in fields(WHPName)
+    if field.name
+    not in {"alt_depth", "whp_name_alias", "whp_unit_alias", "error_col", "flag_col"}
+)
+
+
 class _WHPNames(dict[WHPNameKey, WHPName]):
     """A Mapping (i.e. dict) providing a lookup between a WOCE style param and unit to an instance of :class:`WHPName`
 
@@ -197,6 +256,101 @@ class _WHPNames(dict[WHPNameKey, WHPName]):
             return param.as_error()
         return param
 
+    @cached_property
+    def _cf_indexes(
+        self,
+    ) -> tuple[
+        dict[str, tuple[WHPName, ...]],
+        dict[str, tuple[WHPName, ...]],
+        dict[tuple[str, str], tuple[WHPName, ...]],
+    ]:
+        by_name: dict[str, list[WHPName]] = {}
+        by_units: dict[str, list[WHPName]] = {}
+        by_name_units: dict[tuple[str, str], list[WHPName]] = {}
+        for param in sorted(set(self.values())):
+            attrs = param.get_nc_attrs()
+            standard_name = attrs.get("standard_name")
+            units = attrs.get("units")
+            if standard_name is not None:
+                by_name.setdefault(standard_name, []).append(param)
+            if units is not None:
+                by_units.setdefault(units, []).append(param)
+            if standard_name is not None and units is not None:
+                by_name_units.setdefault((standard_name, units), []).append(param)
+
+        return (
+            {k: tuple(v) for k, v in by_name.items()},
+            {k: tuple(v) for k, v in by_units.items()},
+            {k: tuple(v) for k, v in by_name_units.items()},
+        )
+
+    def from_cf_attrs(
+        self, standard_name: str | None = None, units: str | None = None
+    ) -> tuple[WHPName, ...]:
+        """Find the candidate WHPNames for a netCDF variable from its ``standard_name`` and ``units`` attributes
+
+        The candidates are in WOCE order, an empty tuple is returned if there are none.
+        CF standard name aliases are resolved to their canonical name and
+        a ``standard_error`` modifier returns the error versions of the candidates.
+        Units must exactly match the ``units`` attribute :meth:`WHPName.get_nc_attrs` would write.
+
+        >>> WHPNames.from_cf_attrs("sea_water_pressure", "dbar")
+        (WHPName("CTDPRS [DBAR]"), WHPName("CTDRAW [DBAR]"), WHPName("REVPRS [DBAR]"), WHPName("DWNPRS [DBAR]"))
+
+        :param standard_name: the CF standard name of the variable, or None to match only on units
+        :param units: the units of the variable, or None to match only on the standard name
+        """
+        if standard_name is None and units is None:
+            raise ValueError("at least one of standard_name or units is required")
+
+        error = False
+        if standard_name is not None:
+            standard_name = standard_name.strip()
+            if standard_name.endswith(" standard_error"):
+                standard_name = standard_name.removesuffix(" standard_error").strip()
+                error = True
+            if standard_name in CFStandardNames.aliases:
+                standard_name = CFStandardNames.aliases[standard_name]
+        if units is not None:
+            units = units.strip()
+
+        by_name, by_units, by_name_units = self._cf_indexes
+        if standard_name is None:
+            candidates = by_units.get(units, ())  # type: ignore[arg-type]
+        elif units is None:
+            candidates = by_name.get(standard_name, ())
+        else:
+            candidates = by_name_units.get((standard_name, units), ())
+
+        if error:
+            return tuple(
+                param.as_error() for param in candidates if param.error_name is not None
+            )
+        return candidates
+
+    def from_cf_attrs_batch(
+        self, variables: Mapping[str, Mapping[str, str]]
+    ) -> dict[str, tuple[WHPName, ...]]:
+        """Find the candidate WHPNames for every variable of a dataset, see :meth:`_WHPNames.from_cf_attrs`
+
+        Variables which have neither a ``standard_name`` nor ``units`` attribute are omitted from the result.
+
+        >>> WHPNames.from_cf_attrs_batch({"oxy": {"standard_name": "moles_of_oxygen_per_unit_mass_in_sea_water", "units": "umol/kg"}})
+        {'oxy': (WHPName("CTDOXY [UMOL/KG]"), WHPName("OXYGEN [UMOL/KG]"), WHPName("DWNOXY [UMOL/KG]"))}
+
+        :param variables: mapping of variable names to their attributes, e.g. ``{k: v.attrs for k, v in ds.variables.items()}``
+        """
+        seen: dict[tuple[str | None, str | None], tuple[WHPName, ...]] = {}
+        results = {}
+        for name, attrs in variables.items():
+            key = (attrs.get("standard_name"), attrs.get("units"))
+            if key == (None, None):
+                continue
+            if key not in seen:
+                seen[key] = self.from_cf_attrs(*key)
+            results[name] = seen[key]
+        return results
+
     def __getitem__(self, key: WHPNameKey | WHPName) -> WHPName:
         error = False
         (name, unit), flag = normalize_whp_name_key(key)
@@ -217,6 +371,10 @@ class _WHPNames(dict[WHPNameKey, WHPName]):
             case _ as err:
                 raise KeyError(f"whpname keys must be str or a tuple, found {err}")
 
+        if not flag:
+            # tuple keys may carry the flag suffix, aliases are keyed without it
+            name, flag = flag_name(name)
+
         alias_key = None
         if (name, unit) in self._aliases:
             alias_key = (name, unit)
@@ -251,6 +409,16 @@ class _WHPNames(dict[WHPNameKey, WHPName]):
     def __contains__(self, key: object) -> bool:
         return super().__contains__(key) or key in self.odv_names
 
+    @cached_property
+    def _header_plans(self) -> dict:
+        """Resolved :mod:`cchdo.params.header` plans keyed by header fingerprint and strictness"""
+        return {}
+
+    @cached_property
+    def _header_params(self) -> dict[tuple[str, str | None], WHPName]:
+        """Lookups of (name, unit) header columns, shared by every header :mod:`cchdo.params.header` parses"""
+        return {}
+
     @cached_property
     def error_cols(self):
         """A mapping of all the error names to their corresponding WHPName
@@ -264,6 +432,153 @@ class _WHPNames(dict[WHPNameKey, WHPName]):
             if ex.error_name is not None
         }
 
+    @cached_property
+    def _attribute_indexes(self) -> dict[str, dict[object, frozenset[WHPName]]]:
+        # filled in lazily by _attribute_index
+        return {}
+
+    @cached_property
+    def _sorted_indexes(self) -> dict[str, tuple[list, list[WHPName]]]:
+        # filled in lazily by in_range
+        return {}
+
+    def _attribute_index(self, attr: str) -> dict[object, frozenset[WHPName]]:
+        """Mapping of each value of `attr` to the frozenset of WHPNames having that value"""
+        if attr not in self._attribute_indexes:
+            if attr not in _WHPNAME_FIELDS:
+                raise ValueError(f"{attr} is not a WHPName field")
+            groups: dict[object, set[WHPName]] = {}
+            for param in self.values():
+                groups.setdefault(getattr(param, attr), set()).add(param)
+            self._attribute_indexes[attr] = {
+                value: frozenset(params) for value, params in groups.items()
+            }
+        return self._attribute_indexes[attr]
+
+    def where(self, **criteria) -> frozenset[WHPName]:
+        """The WHPNames whose fields have the given values
+
+        Each keyword is a :class:`WHPName` field name.
+        If the value is a set, frozenset, or list, any of the values will match.
+        All the criteria must match, the results are frozensets so they can be combined with the usual set operators.
+
+        >>> WHPNames.where(whp_name="CTDPRS")
+        frozenset({WHPName("CTDPRS [DBAR]")})
+        >>> WHPNames.where(flag_w="woce_ctd", dtype="decimal") <= WHPNames.where(in_erddap={True, False})
+        True
+        """
+        result: frozenset[WHPName] | None = None
+        for attr, value in criteria.items():
+            index = self._attribute_index(attr)
+            if isinstance(value, set | frozenset | list):
+                matches = frozenset().union(*(index.get(v, frozenset()) for v in value))
+            else:
+                matches = index.get(value, frozenset())
+            result = matches if result is None else result & matches
+            if not result:
+                return frozenset()
+
+        if result is None:
+            return frozenset(self.values())
+        return result
+
+    def having(self, *attrs: str) -> frozenset[WHPName]:
+        """The WHPNames where all the given fields are not None
+
+        >>> WHPNames["DELC14 [/MILLE]"] in WHPNames.having("error_name")
+        True
+        """
+        result = frozenset(self.values())
+        for attr in attrs:
+            index = self._attribute_index(attr)
+            result = result - index.get(None, frozenset())
+        return result
+
+    def in_range(
+        self, attr: str, low: float | None = None, high: float | None = None
+    ) -> frozenset[WHPName]:
+        """The WHPNames where the numeric field `attr` is between `low` and `high` inclusive
+
+        WHPNames where `attr` is None never match, omit a bound to leave that side open.
+
+        >>> WHPNames.in_range("radiation_wavelength", 440, 450) <= WHPNames.having("radiation_wavelength")
+        True
+        """
+        if attr not in self._sorted_indexes:
+            pairs = sorted(
+                (value, param)
+                for value, params in self._attribute_index(attr).items()
+                if value is not None
+                for param in params
+            )
+            self._sorted_indexes[attr] = (
+                [value for value, _ in pairs],
+                [param for _, param in pairs],
+            )
+        values, params = self._sorted_indexes[attr]
+
+        start = 0 if low is None else bisect_left(values, low)
+        stop = len(values) if high is None else bisect_right(values, high)
+        return frozenset(params[start:stop])
+
+    @cached_property
+    def columns(self) -> dict[str, tuple]:
+        """The whole table of parameters as columns, a mapping of field name to a tuple of values
+
+        Rows are in WOCE order and the API only fields (e.g. ``alt_depth``, ``flag_col``) are not included.
+        This is directly usable to make a ``pandas.DataFrame`` or ``pyarrow.Table``.
+
+        >>> WHPNames.columns["whp_name"][:3]
+        ('EXPOCODE', 'SECT_ID', 'LINE')
+        """
+        params = sorted(set(self.values()))
+        return {
+            field.name: tuple(getattr(param, field.name) for param in params)
+            for field in _COLUMN_FIELDS
+        }
+
+    @cached_property
+    def _numpy_table(self):
+        import numpy as np
+
+        columns = self.columns
+        dtypes = []
+        values = []
+        for field in _COLUMN_FIELDS:
+            column = columns[field.name]
+            if field.type is bool:
+                dtypes.append((field.name, "?"))
+                values.append(column)
+            elif field.type is int:
+                dtypes.append((field.name, "i8"))
+                values.append(column)
+            elif field.type is float or set(get_args(field.type)) & {int, float}:
+                dtypes.append((field.name, "f8"))
+                values.append([np.nan if value is None else value for value in column])
+            else:
+                strings = ["" if value is None else value for value in column]
+                width = max(1, *(len(string) for string in strings))
+                dtypes.append((field.name, f"U{width}"))
+                values.append(strings)
+
+        table = np.empty(len(values[0]), dtype=dtypes)
+        for (name, _), column in zip(dtypes, values, strict=True):
+            table[name] = column
+        table.flags.writeable = False
+        return table
+
+    def to_numpy(self):
+        """The :class:`_WHPNames.columns` as a read only numpy structured array, requires numpy
+
+        The array is built once and cached.
+        Strings become fixed width unicode fields with None as an empty string,
+        optional numbers (including ``numeric_precision`` and ``whp_number``) become float64 fields with None as NaN.
+
+        >>> WHPNames.to_numpy()["whp_name"][0]
+        np.str_('EXPOCODE')
+        """
+        return self._numpy_table
+
     def _scope_filter(self, scope: str = "cruise") -> tuple[WHPName, ...]:
         return tuple(sorted(name for name in self.values() if name.scope == scope))
 
@@ -295,6 +610,42 @@ class _WHPNames(dict[WHPNameKey, WHPName]):
             files("cchdo.params").joinpath("parameters.schema.json").read_text()
         )
 
+    @cached_property
+    def legacy_json_validator(self):
+        """A precompiled JSONSchema validator for entire :class:`_WHPNames.legacy_json` documents
+
+        The schema is checked once when the validator is built.
+        Requires the optional jsonschema package (installed with the ``selftest`` extra).
+
+        >>> WHPNames.legacy_json_validator.is_valid(WHPNames.legacy_json)
+        True
+        """
+        from jsonschema.validators import validator_for
+
+        schema = self.legacy_json_schema
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        return cls(schema)
+
+    @cached_property
+    def legacy_json_record_validator(self):
+        """A precompiled JSONSchema validator for a single record of a :class:`_WHPNames.legacy_json` document
+
+        Use this to validate records as they are produced rather than the whole document at once.
+
+        >>> WHPNames.legacy_json_record_validator.is_valid(WHPNames.legacy_json[0])
+        True
+        """
+        return self.legacy_json_validator.evolve(
+            schema=self.legacy_json_schema["items"]
+        )
+
+    def _legacy_json_records(self) -> Iterator[dict]:
+        """Yields each record of :class:`_WHPNames.legacy_json` one at a time, in order"""
+        results = dict.fromkeys(sorted(self.values(), key=lambda x: x.rank))
+        for result in results:
+            yield _legacy_json_record(result)
+
     @cached_property
     def legacy_json(self):
         """Provides the params database in the format expected in the old json database
@@ -305,50 +656,46 @@ class _WHPNames(dict[WHPNameKey, WHPName]):
         This property is the corresponding python object and not JSON text, it must still be serialized.
         This property will validate against the schema in :class:`_WHPNames.legacy_json_schema`
         """
+        return list(self._legacy_json_records())
 
-        results = list(
-            dict.fromkeys(sorted(self.values(), key=lambda x: x.rank)).keys()
-        )
+    def iter_legacy_json(self, validate: bool = False) -> Iterator[str]:
+        """Yields the :class:`_WHPNames.legacy_json` document as JSON text in chunks, one record per chunk
 
-        required = ["whp_name", "whp_unit", "flag_w", "data_type", "field_width"]
-        params = []
-        for result in results:
-            p_dict = asdict(result)
-            p_dict["data_type"] = p_dict.pop("dtype")
-
-            # cleanup things
-            del p_dict["nc_name"]
-            del p_dict["rank"]
-            del p_dict["analytical_temperature_name"]
-            del p_dict["analytical_temperature_units"]
-            del p_dict["radiation_wavelength"]
-            del p_dict["scattering_angle"]
-            del p_dict["excitation_wavelength"]
-            del p_dict["emission_wavelength"]
-            del p_dict["nc_group"]
-            del p_dict["in_erddap"]
-            del p_dict["alt_depth"]
-            del p_dict["flag_col"]
-            del p_dict["error_col"]
-
-            if p_dict["data_type"] == "string":
-                del p_dict["numeric_min"]
-                del p_dict["numeric_max"]
-                del p_dict["numeric_precision"]
-
-            if p_dict["flag_w"] == "no_flags":
-                p_dict["flag_w"] = None
-
-            keys_to_del = []
-            for k, v in p_dict.items():
-                if v is None and k not in required:
-                    keys_to_del.append(k)
-            for k in keys_to_del:
-                del p_dict[k]
-
-            params.append(p_dict)
-
-        return params
+        The joined chunks are identical to ``json.dumps(WHPNames.legacy_json, indent=2, sort_keys=True)``,
+        but records are serialized as they are needed, the whole document is never held in memory.
+
+        :param validate: if True, each record is checked with :class:`_WHPNames.legacy_json_record_validator`
+                         before it is emitted, raising a ``jsonschema.ValidationError`` if it is invalid
+        """
+        validator = self.legacy_json_record_validator if validate else None
+        yield "["
+        sep = "\n"
+        for record in self._legacy_json_records():
+            if validator is not None:
+                validator.validate(record)
+            yield sep
+            yield indent(dumps(record, indent=2, sort_keys=True), "  ")
+            sep = ",\n"
+        if sep == "\n":
+            yield "]"
+        else:
+            yield "\n]"
+
+    def dump_legacy_json(self, fp: IO[str], validate: bool = False) -> None:
+        """Write the :class:`_WHPNames.legacy_json` document as JSON text to a file like object, one record at a time
+
+        :param validate: validate each record before it is written, see :class:`_WHPNames.iter_legacy_json`
+        """
+        for chunk in self.iter_legacy_json(validate=validate):
+            fp.write(chunk)
+
+    @cached_property
+    def legacy_json_bytes(self) -> bytes:
+        """The :class:`_WHPNames.legacy_json` document serialized as UTF-8 JSON bytes
+
+        This is built once and cached, it is suitable for serving repeatedly without re-serializing.
+        """
+        return "".join(self.iter_legacy_json()).encode("utf8")
 
     def add_alias(self, alias: WHPNameKey, current: WHPNameKey):
         """Adds an alias to the WHPNames dict for this session only
@@ -371,12 +718,106 @@ class _WHPNames(dict[WHPNameKey, WHPName]):
             ...
             # emit a warning?
 
+        # keep the table flat, aliases of aliases point at the final parameter
+        current = self._aliases.get(current, current)
+
         self[current]  # this needs to not raise
 
         self._aliases[alias] = current
+        # a new alias may change how a previously seen header resolves
+        self.__dict__.pop("_header_plans", None)
+        self.__dict__.pop("_header_params", None)
+
+
+class _CFStandardNames(dict[str | None, CFStandardName]):
+    """A Mapping (i.e. dict) of CF standard names, and their aliases, to instances of :class:`CFStandardName`
 
+    .. warning::
+      This class should not be directly used, instead use the premade :data:`CFStandardNames` instance from this module
+
+    An alias is a key whose :class:`CFStandardName` has a different name, looking it up returns the canonical name:
+
+    >>> CFStandardNames["sea_floor_depth"]
+    CFStandardName(name='sea_floor_depth_below_geoid', canonical_units='m', grib=None, amip='zobt')
+    >>> CFStandardNames.is_alias("sea_floor_depth")
+    True
+    >>> CFStandardNames.canonical("sea_floor_depth")
+    'sea_floor_depth_below_geoid'
+
+    The reverse indexes are built the first time they are used and cached,
+    like the indexes of :class:`_WHPNames` they do not see later changes to the mapping.
+    """
+
+    @cached_property
+    def aliases(self) -> dict[str, str]:
+        """A mapping of each alias to the name of its canonical standard name"""
+        return {
+            key: cf_name.name
+            for key, cf_name in self.items()
+            if key is not None and key != cf_name.name
+        }
+
+    def is_alias(self, name: str) -> bool:
+        """True if `name` is an alias rather than a canonical standard name"""
+        return name in self.aliases
+
+    def canonical(self, name: str) -> str:
+        """The canonical standard name of `name`, which is returned unchanged if it is already canonical
+
+        :raises KeyError: if `name` is not a known standard name or alias
+        """
+        return self[name].name
+
+    @cached_property
+    def _reverse_indexes(self) -> dict[str, dict[str, tuple[CFStandardName, ...]]]:
+        indexes: dict[str, dict[str, list[CFStandardName]]] = {
+            "canonical_units": {},
+            "grib": {},
+            "amip": {},
+        }
+        canonical = sorted(
+            (cf_name for key, cf_name in self.items() if key == cf_name.name),
+            key=lambda cf_name: cf_name.name,
+        )
+        for cf_name in canonical:
+            if cf_name.canonical_units is not None:
+                indexes["canonical_units"].setdefault(
+                    cf_name.canonical_units, []
+                ).append(cf_name)
+            # a standard name may have several space separated codes, e.g. "2 E151"
+            for code in (cf_name.grib or "").split():
+                indexes["grib"].setdefault(code, []).append(cf_name)
+            for code in (cf_name.amip or "").split():
+                indexes["amip"].setdefault(code, []).append(cf_name)
+
+        return {
+            attr: {value: tuple(names) for value, names in index.items()}
+            for attr, index in indexes.items()
+        }
+
+    def by_canonical_units(self, units: str) -> tuple[CFStandardName, ...]:
+        """All the canonical standard names with exactly these ``canonical_units``, sorted by name
 
-class _CFStandardNames(UserDict[str | None, CFStandardName]): ...
+        >>> [cf_name.name for cf_name in CFStandardNames.by_canonical_units("dbar")]
+        ['sea_water_pressure', 'sea_water_pressure_at_sea_floor', 'sea_water_pressure_at_sea_water_surface', 'sea_water_pressure_due_to_sea_water']
+        """
+        return self._reverse_indexes["canonical_units"].get(units, ())
+
+    def by_grib(self, code: str) -> tuple[CFStandardName, ...]:
+        """All the canonical standard names with this GRIB parameter code, sorted by name
+
+        >>> CFStandardNames.by_grib("E151")
+        (CFStandardName(name='air_pressure_at_mean_sea_level', canonical_units='Pa', grib='2 E151', amip='psl'),)
+        """
+        return self._reverse_indexes["grib"].get(code, ())
+
+    def by_amip(self, code: str) -> tuple[CFStandardName, ...]:
+        """All the canonical standard names with this AMIP code, sorted by name
+
+        >>> CFStandardNames.by_amip("psl")
+        (CFStandardName(name='air_pressure_at_mean_sea_level', canonical_units='Pa', grib='2 E151', amip='psl'),)
+        """
+        return self._reverse_indexes["amip"].get(code, ())
 
 
 def default_cf_standard_names() -> _CFStandardNames:
@@ -386,8 +827,8 @@ def default_cf_standard_names() -> _CFStandardNames:
 def default_whp_names() -> _WHPNames:
     whpnames = _WHPNames(_whp_names)
 
-    for _alias, _canonical in _aliases.items():
-        whpnames.add_alias(_alias, _canonical)
+    # the generated alias table was flattened and validated by gen_code
+    whpnames._aliases.update(_aliases)
 
     return whpnames
 
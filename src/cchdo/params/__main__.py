@@ -1,4 +1,6 @@
+import csv
 import json
+from hashlib import sha256
 from importlib.resources import as_file, files
 from textwrap import dedent
 
@@ -22,86 +24,68 @@ def whp():
 
 @cf.command(name="update")
 @click.argument("cf_xml", type=click.Path(exists=True))
-def cf_update(cf_xml):
-    from xml.etree import ElementTree
-
-    from .db import CFAlias, CFName, ConfigDict, database
+@click.option(
+    "--report",
+    type=click.File("w", encoding="utf8"),
+    default=None,
+    help="Write a JSON report of the changes to this file, use - for stdout",
+)
+@click.option(
+    "--dry-run", is_flag=True, help="Report the changes without applying them"
+)
+def cf_update(cf_xml, report, dry_run):
+    from .db import (
+        ConfigDict,
+        apply_cf_staging,
+        database,
+        diff_cf_staging,
+        stage_cf_xml,
+    )
 
     conf = ConfigDict()
     current_cf_version_number = conf["cf_version_number"]
 
-    cf_names = {}
-    cf_aliases = {}
-    version_number = None
-    last_mod = None
-    for element in ElementTree.parse(cf_xml).getroot():
-        if element.tag == "version_number":
-            if element.text is None:
-                raise ValueError("no cf standard name table version number")
-            version_number = int(element.text)
-            if int(current_cf_version_number) >= version_number:
-                click.echo(
-                    f"Internal CF Version ({current_cf_version_number}) is the same or newer than the cf xml ({version_number})"
-                )
-                quit(1)
-        if element.tag == "last_modified":
-            last_mod = element.text
-
-        if element.tag not in ("entry", "alias"):
-            continue
-
-        name = element.attrib["id"]
-        name_info = {info.tag: info.text for info in element}
-
-        if element.tag == "entry":
-            cf_names[name] = {"standard_name": name, **name_info}
-
-        if element.tag == "alias":
-            cf_aliases[name] = {"alias": name, "standard_name": name_info["entry_id"]}
-
     with database() as session:
-        exising_cf_names = {r.standard_name: r for r in session.query(CFName).all()}
-        existing_cf_aliases = {r.alias: r for r in session.query(CFAlias).all()}
-
-        for alias, record in cf_aliases.items():
-            if alias not in existing_cf_aliases:
-                session.add(CFAlias(**cf_aliases[alias]))
-            elif record["standard_name"] != existing_cf_aliases[alias].standard_name:
-                existing = existing_cf_aliases[alias]
-                existing.standard_name = cf_aliases[alias]["standard_name"]
-                session.add(existing)
-        for alias, record in existing_cf_aliases.items():
-            if alias not in cf_aliases:
-                session.delete(existing_cf_aliases[alias])
-
-        for name, record in cf_names.items():
-            if name not in exising_cf_names:
-                session.add(CFName(**record))
-            else:
-                dirty = False
-                existing = exising_cf_names[name]
-                for key, value in record.items():
-                    if getattr(existing, key) != value:
-                        dirty = True
-                        setattr(existing, key, value)
-                if dirty:
-                    session.add(existing)
-        for name, record in exising_cf_names.items():
-            if name not in cf_names:
-                session.delete(exising_cf_names[name])
-
-        if len(session.new) > 0:
-            print("Objects to be added:")
-            for obj in session.new:
-                print(obj)
-        if len(session.deleted) > 0:
-            print("Objects to be removed:")
-            for obj in session.deleted:
-                print(obj)
-        if len(session.dirty) > 0:
-            print("Objects to be modified:")
-            for obj in session.dirty:
-                print(obj)
+        info = stage_cf_xml(session, cf_xml)
+
+        if info.get("version_number") is None:
+            raise ValueError("no cf standard name table version number")
+        version_number = int(info["version_number"])  # type: ignore[arg-type]
+        last_mod = info.get("last_modified")
+        if int(current_cf_version_number) >= version_number:
+            click.echo(
+                f"Internal CF Version ({current_cf_version_number}) is the same or newer than the cf xml ({version_number})"
+            )
+            quit(1)
+
+        changes = diff_cf_staging(session)
+        for table, diff in changes.items():
+            for kind, names in diff.items():
+                if len(names) == 0:
+                    continue
+                click.echo(f"{table} {kind} ({len(names)}):", err=True)
+                for name in names:
+                    click.echo(f"  {name}", err=True)
+
+        if report is not None:
+            json.dump(
+                {
+                    "version_number": version_number,
+                    "previous_version_number": int(current_cf_version_number),
+                    "last_modified": last_mod,
+                    "dry_run": dry_run,
+                    **changes,
+                },
+                report,
+                indent=2,
+            )
+            report.write("\n")
+
+        if dry_run:
+            session.rollback()
+            return
+
+        apply_cf_staging(session)
         session.commit()
 
     conf["cf_version_number"] = version_number
@@ -109,29 +93,321 @@ def cf_update(cf_xml):
 
 
 @whp.command(name="json")
-def ex_json():
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w", encoding="utf8"),
+    default="-",
+    help="Write the document to this file rather than stdout",
+)
+@click.option(
+    "--validate",
+    is_flag=True,
+    help="Validate each record against the schema as it is written",
+)
+def ex_json(output, validate):
+    """Write the legacy json parameters document"""
     from . import WHPNames
 
-    print(json.dumps(WHPNames.legacy_json, indent=2, sort_keys=True))
+    WHPNames.dump_legacy_json(output, validate=validate)
+    output.write("\n")
+
+
+@cli.command()
+@click.argument("query", nargs=-1, required=True)
+@click.option("-n", "--limit", default=20, show_default=True)
+@click.option("--kind", type=click.Choice(["whp", "cf"]), default=None)
+def search(query, limit, kind):
+    """Full text search of the WHP and CF standard names"""
+    from . import search
+
+    for hit in search(" ".join(query), limit=limit, kind=kind):
+        click.echo(f"{hit.score:.2f}\t{hit.kind}\t{hit.key}")
+
+
+@cli.command()
+@click.argument("prefix")
+@click.option("-n", "--limit", default=20, show_default=True)
+@click.option("--kind", type=click.Choice(["whp", "cf"]), default=None)
+def complete(prefix, limit, kind):
+    """Complete a partial ODV style key, nc_name, or CF standard name"""
+    from . import complete
+
+    for completion in complete(prefix, limit=limit, kind=kind):
+        click.echo(f"{completion.kind}\t{completion.text}\t{completion.key}")
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8000, show_default=True)
+@click.option(
+    "--unix",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Listen on this Unix socket path instead of TCP",
+)
+def serve(host, port, unix):
+    """Serve parameter lookups over local HTTP
+
+    Endpoints are /resolve, /nc_attrs, /search, and /legacy_json,
+    each accepts GET query parameters or a POST of a JSON array for batches.
+    """
+    import asyncio
+
+    from ._service import serve
+
+    where = unix if unix is not None else f"http://{host}:{port}"
+    click.echo(f"Serving on {where}", err=True)
+    try:
+        asyncio.run(serve(host, port, unix))
+    except KeyboardInterrupt:
+        pass
+
+
+def _ndjson_key(value):
+    """The lookup key of an ndjson value, a ValueError if it is not a name, [name, unit] array, or {"key": ...} object"""
+    if isinstance(value, dict):
+        if "key" not in value:
+            raise ValueError('object has no "key" member')
+        value = value["key"]
+    if isinstance(value, str):
+        return value
+    if (
+        isinstance(value, list)
+        and len(value) in (1, 2)
+        and isinstance(value[0], str)
+        and (len(value) == 1 or value[1] is None or isinstance(value[1], str))
+    ):
+        return tuple(value)
+    raise ValueError(f"not a name or [name, unit] array: {json.dumps(value)}")
+
+
+def _iter_keys(fp, input_format):
+    """Yield the (input, key, error) of each name to resolve from an open text file
+
+    A line which cannot be read is yielded with an error message rather than raised,
+    so one bad line does not stop the stream.
+    """
+    if input_format == "csv":
+        from .archive import header_lookup_keys
+        from .header import canonical_header
+
+        rows = (
+            row
+            for row in csv.reader(fp)
+            if any(cell.strip() for cell in row) and not row[0].startswith("#")
+        )
+        for params in rows:
+            if (units := next(rows, None)) is None:
+                yield params, None, "ValueError: parameter line has no units line"
+                return
+            try:
+                keys = list(header_lookup_keys(canonical_header(params, units)))
+            except ValueError as err:
+                yield params, None, f"ValueError: {err}"
+                continue
+            for key in keys:
+                yield list(key), key, None
+        return
+
+    for line in fp:
+        line = line.strip()
+        if line == "":
+            continue
+        if input_format == "ndjson":
+            try:
+                value = json.loads(line)
+            except ValueError as err:
+                yield line, None, f"JSONDecodeError: {err}"
+                continue
+            try:
+                yield value, _ndjson_key(value), None
+            except ValueError as err:
+                yield value, None, f"ValueError: {err}"
+        else:
+            yield line, line, None
+
+
+@cli.command()
+@click.argument(
+    "inputs", nargs=-1, type=click.File("r", encoding="utf8"), default=("-",)
+)
+@click.option(
+    "-f",
+    "--format",
+    "input_format",
+    type=click.Choice(["lines", "csv", "ndjson"]),
+    default="lines",
+    show_default=True,
+    help="lines: one name or ODV string per line, "
+    "csv: Exchange style parameter lines each followed by their units line, "
+    'ndjson: one JSON string, [name, unit] array, or {"key": ...} object per line',
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w", encoding="utf8"),
+    default="-",
+    help="Write the results to this file rather than stdout",
+)
+def resolve(inputs, input_format, output):
+    """Resolve WHP names from INPUTS (or stdin) and write one JSON result per line
+
+    Each result has the canonical key, nc_name, flag/error/alt role, any alias used,
+    and an error message if the name did not resolve or the input could not be read.
+    """
+    from . import WHPNames
+    from ._service import resolve_record
+
+    # archive inventories repeat the same names many times, each distinct key is resolved and encoded once
+    resolved: dict = {}
+    for fp in inputs:
+        for value, key, error in _iter_keys(fp, input_format):
+            if error is not None:
+                output.write(json.dumps({"input": value, "error": error}))
+                output.write("\n")
+                continue
+            if (rest := resolved.get(key)) is None:
+                record = resolve_record(WHPNames, key)
+                del record["input"]
+                # everything after the input member, which differs between inputs with the same key
+                rest = resolved[key] = json.dumps(record)[1:]
+            output.write('{"input": ')
+            output.write(json.dumps(value))
+            output.write(", ")
+            output.write(rest)
+            output.write("\n")
+
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="Number of worker processes, defaults to the number of cpus",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w", encoding="utf8"),
+    default="-",
+    help="Write the JSON report to this file rather than stdout",
+)
+def survey(paths, jobs, output):
+    """Survey the parameters used in the Exchange csv and zip files under PATHS"""
+    from .archive import survey
+
+    report = survey(paths, max_workers=jobs)
+    click.echo(
+        f"{report['files']} files, {report['distinct_headers']} distinct headers, "
+        f"{report['unresolved']} unresolved columns, "
+        f"{len(report['invalid_headers'])} invalid headers",
+        err=True,
+    )
+    json.dump(report, output, indent=2)
+    output.write("\n")
+
+
+@cli.group()
+def index():
+    """Maintain and query a persistent index of the parameters used in an archive"""
+
+
+@index.command(name="update")
+@click.argument("db", type=click.Path(dir_okay=False))
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="Number of worker processes, defaults to the number of cpus",
+)
+def index_update(db, paths, jobs):
+    """Index the Exchange csv and zip files under PATHS into the sqlite file DB"""
+    from .archive import ArchiveIndex
+
+    with ArchiveIndex(db) as archive_index:
+        stats = archive_index.update(paths, max_workers=jobs)
+    click.echo(", ".join(f"{count} {name}" for name, count in stats.items()), err=True)
+
+
+@index.command(name="query")
+@click.argument("db", type=click.Path(exists=True, dir_okay=False))
+@click.option("--param", default=None, help="canonical whp_name")
+@click.option("--unit", default=None, help='canonical whp_unit, "" for unitless')
+@click.option(
+    "--alias/--no-alias",
+    default=None,
+    help="Only columns that did (or did not) use an alias",
+)
+@click.option("--name", default=None, help="column name as written in the file")
+@click.option(
+    "--written-unit", default=None, help='unit as written in the file, "" for none'
+)
+def index_query(db, param, unit, alias, name, written_unit):
+    """List the files and columns in the index DB which resolved to matching parameters
+
+    e.g. the files which wrote the alias CTDPRS [DBARS]: --name CTDPRS --written-unit DBARS
+    """
+    from .archive import ArchiveIndex
+
+    with ArchiveIndex(db) as archive_index:
+        hits = archive_index.query(
+            param=param,
+            unit=unit,
+            alias=alias,
+            name=name,
+            written_unit=written_unit,
+        )
+        for hit in hits:
+            member = "" if hit.member is None else hit.member
+            click.echo(f"{hit.path}\t{member}\t{hit.position}\t{hit.key}")
 
 
 @cli.command()
 def dump_db():
-    import sqlite3
+    """Dump the params database as SQL text along with its digest index"""
+    from .dump import package_files, write_dump
+
+    write_dump(*package_files())
+
+
+def _write_generated(name: str, code: str, check: bool) -> bool:
+    """Write generated code to the package file `name` if its content hash differs
+
+    :returns: True if the file was (or with `check`, would be) changed
+    """
+    with as_file(files("cchdo.params") / name) as p:
+        new_digest = sha256(code.encode("utf8")).hexdigest()
+        if p.exists() and sha256(p.read_bytes()).hexdigest() == new_digest:
+            click.echo(f"{name} is up to date", err=True)
+            return False
 
-    with as_file(files("cchdo.params") / "params.sqlite3") as p:
-        with sqlite3.connect(p) as conn:
-            with p.with_suffix(".sqlite3.sql").open("w") as f:
-                for line in conn.iterdump():
-                    f.write(f"{line}\n")
+        if check:
+            click.echo(f"{name} is out of date", err=True)
+            return True
+
+        with p.open("w", encoding="utf8", newline="\n") as f:
+            f.write(code)
+        click.echo(f"{name} updated", err=True)
+        return True
 
 
 @cli.command()
-def gen_code():
+@click.option(
+    "--check",
+    is_flag=True,
+    help="Do not write anything, exit with status 1 if the generated code is out of date",
+)
+def gen_code(check):
     from jinja2 import Template
     from sqlalchemy import select
+    from sqlalchemy.orm import joinedload
 
-    from .db import Alias, CFAlias, CFName, WHPName, database
+    from .db import Alias, CFAlias, CFName, WHPName, compile_aliases, database
 
     template = Template(
         dedent(
@@ -150,8 +426,8 @@ def gen_code():
         whp_names[name.key] = name
 
     _aliases = {
-    {% for alias in aliases -%}
-    {{"(%r, %r)"| format(alias.old_name, alias.old_unit)}}: {{"(%r, %r)"| format(alias.whp_name, alias.whp_unit)}},
+    {% for alias, target in aliases.items() -%}
+    {{"(%r, %r)"| format(*alias)}}: {{"(%r, %r)"| format(*target)}},
     {% endfor -%}
     }
 
@@ -160,13 +436,27 @@ def gen_code():
     )
 
     with database() as session:
-        whpnames = session.execute(select(WHPName)).scalars().all()
-        aliases = session.execute(select(Alias)).scalars().all()
+        # the code property uses both relationships, load them up front rather than per row
+        whpnames = (
+            session.execute(
+                select(WHPName).options(
+                    joinedload(WHPName.param), joinedload(WHPName.unit)
+                )
+            )
+            .scalars()
+            .all()
+        )
+        # validate and flatten the aliases here so the import time load is a plain dict update
+        aliases = compile_aliases(
+            {
+                (alias.old_name, alias.old_unit): (alias.whp_name, alias.whp_unit)
+                for alias in session.execute(select(Alias)).scalars()
+            },
+            {(name.whp_name, name.whp_unit) for name in whpnames},
+        )
         whp_names_code = template.render(whpnames=whpnames, aliases=aliases)
 
-    with as_file(files("cchdo.params") / "_whp_names.py") as p:
-        with p.open("w") as f:
-            f.write(whp_names_code)
+    changed = _write_generated("_whp_names.py", whp_names_code, check)
 
     # CF names
     template = Template(
@@ -195,9 +485,10 @@ def gen_code():
         aliases = session.execute(select(CFAlias)).scalars().all()
         cf_names_code = template.render(cfnames=cfnames, aliases=aliases)
 
-    with as_file(files("cchdo.params") / "_cf_names.py") as p:
-        with p.open("w") as f:
-            f.write(cf_names_code)
+    changed |= _write_generated("_cf_names.py", cf_names_code, check)
+
+    if check and changed:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+from bisect import bisect_left
+from functools import cache
+from heapq import nsmallest
+from re import findall
+from sqlite3 import Connection, connect
+from threading import Lock
+from typing import Literal, NamedTuple
+
+from .core import CFStandardName, WHPName
+
+SearchKind = Literal["whp", "cf"]
+
+# relative weights of the fts columns: name, cf_name, nc_name, units, description
+_WEIGHTS = (10.0, 4.0, 6.0, 2.0, 1.0)
+
+_lock = Lock()
+
+
+class SearchHit(NamedTuple):
+    """A single result from :func:`search`"""
+
+    #: relevance of the hit, larger is better
+    score: float
+    #: "whp" for :class:`WHPName` hits, "cf" for :class:`CFStandardName` hits
+    kind: SearchKind
+    #: the ODV style key of a :class:`WHPName` or the name of a :class:`CFStandardName`
+    key: str
+    item: WHPName | CFStandardName
+
+
+def _join(*parts: str | None) -> str:
+    return "\n".join(part for part in parts if part is not None)
+
+
+@cache
+def _index() -> tuple[Connection, tuple[WHPName | CFStandardName, ...]]:
+    """Build the in memory full text index, this happens once on the first search"""
+    from . import CFStandardNames, WHPNames
+
+    items: list[WHPName | CFStandardName] = []
+    rows = []
+    for param in sorted(set(WHPNames.values())):
+        items.append(param)
+        rows.append(
+            (
+                len(items),
+                "whp",
+                param.odv_key,
+                _join(param.whp_name, param.error_name),
+                param.cf_name,
+                param.nc_name,
+                _join(param.whp_unit, param.cf_unit),
+                _join(param.description, param.note, param.warning),
+            )
+        )
+    for key, cf_name in CFStandardNames.items():
+        if CFStandardNames.is_alias(key):  # type: ignore[arg-type]
+            continue
+        items.append(cf_name)
+        rows.append(
+            (
+                len(items),
+                "cf",
+                cf_name.name,
+                cf_name.name,
+                None,
+                None,
+                cf_name.canonical_units,
+                cf_name.description,
+            )
+        )
+
+    conn = connect(":memory:", check_same_thread=False)
+    conn.execute(
+        "CREATE VIRTUAL TABLE search USING fts5("
+        "kind UNINDEXED, key UNINDEXED, name, cf_name, nc_name, units, description)"
+    )
+    conn.executemany(
+        "INSERT INTO search (rowid, kind, key, name, cf_name, nc_name, units, description) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.execute("INSERT INTO search (search) VALUES ('optimize')")
+    return conn, tuple(items)
+
+
+def _fts_query(query: str) -> str:
+    """Turn free text into an fts5 query matching all the words as prefixes
+
+    >>> _fts_query("sea_water pres")
+    '"sea"* "water"* "pres"*'
+    """
+    return " ".join(f'"{word}"*' for word in findall(r"[^\W_]+", query))
+
+
+def search(
+    query: str, limit: int = 20, kind: SearchKind | None = None
+) -> list[SearchHit]:
+    """Full text search over the names, nc_names, units, and descriptions of all the WHPNames and CFStandardNames
+
+    Every word in `query` must match (as a prefix) somewhere in a result.
+    Matches in names are ranked above matches in descriptions.
+    The index is built in memory the first time this is called.
+
+    >>> [hit.key for hit in search("ctd pressure", limit=3)]
+    ['CTDPRS [DBAR]', 'CTDRAW [DBAR]', 'ODF_CTDPRS [DBAR]']
+
+    :param query: free text, punctuation is ignored
+    :param limit: the maximum number of hits to return
+    :param kind: only return hits of this kind, "whp" or "cf"
+    """
+    fts_query = _fts_query(query)
+    if fts_query == "":
+        return []
+
+    weights = ", ".join(str(weight) for weight in _WEIGHTS)
+    sql = f"SELECT rowid, kind, key, -bm25(search, 0, 0, {weights}) FROM search WHERE search MATCH ?"
+    params: list = [fts_query]
+    if kind is not None:
+        sql += " AND kind = ?"
+        params.append(kind)
+    sql += " ORDER BY 4 DESC, rowid LIMIT ?"
+    params.append(limit)
+
+    conn, items = _index()
+    with _lock:
+        results = conn.execute(sql, params).fetchall()
+
+    return [
+        SearchHit(score, kind, key, items[rowid - 1])
+        for rowid, kind, key, score in results
+    ]
+
+
+class Completion(NamedTuple):
+    """A single result from :func:`complete`"""
+
+    #: the completed text, an ODV style key, nc_name, or CF standard name (or alias)
+    text: str
+    #: "whp" for :class:`WHPName` completions, "cf" for :class:`CFStandardName` completions
+    kind: SearchKind
+    #: the ODV style key of a :class:`WHPName` or the canonical name of a :class:`CFStandardName`
+    key: str
+    item: WHPName | CFStandardName
+
+
+# the largest code point, appended to a prefix it sorts after every string starting with that prefix
+_MAX_CHAR = "\U0010ffff"
+
+
+@cache
+def _completion_index() -> dict[SearchKind, tuple[list[str], list[Completion]]]:
+    """Sorted casefolded texts and their completions for each kind, built once on the first completion"""
+    from . import CFStandardNames, WHPNames
+
+    whp: dict[str, Completion] = {}
+    for param in sorted(set(WHPNames.values())):
+        for text in (param.odv_key, param.nc_name):
+            # e.g. EXPOCODE and expocode only need one entry
+            whp.setdefault(
+                text.casefold(), Completion(text, "whp", param.odv_key, param)
+            )
+    cf: dict[str, Completion] = {}
+    for key, cf_name in CFStandardNames.items():
+        if key is not None:
+            cf[key.casefold()] = Completion(key, "cf", cf_name.name, cf_name)
+
+    index: dict[SearchKind, tuple[list[str], list[Completion]]] = {}
+    for kind, entries in (("whp", whp), ("cf", cf)):
+        folded = sorted(entries)
+        index[kind] = folded, [entries[text] for text in folded]  # type: ignore[index]
+    return index
+
+
+def _prefix_range(folded: list[str], prefix: str) -> tuple[int, int]:
+    return bisect_left(folded, prefix), bisect_left(folded, prefix + _MAX_CHAR)
+
+
+def complete(
+    prefix: str, limit: int = 20, kind: SearchKind | None = None
+) -> list[Completion]:
+    """Complete a partially typed ODV style key, nc_name, or CF standard name
+
+    Matching is case insensitive.
+    WHP completions come first, in WOCE order (by ``rank``), followed by CF standard names and aliases in alphabetical order.
+    The sorted index is built the first time this is called, each completion is then a binary search.
+
+    >>> [c.text for c in complete("ctdpr", limit=3)]
+    ['CTDPRS [DBAR]']
+    >>> [c.text for c in complete("sea_water_pressure_at")]
+    ['sea_water_pressure_at_sea_floor', 'sea_water_pressure_at_sea_water_surface']
+
+    :param prefix: the text typed so far, an empty prefix completes to everything
+    :param limit: the maximum number of completions to return
+    :param kind: only return completions of this kind, "whp" or "cf"
+    """
+    if limit <= 0:
+        return []
+    prefix = prefix.casefold()
+    index = _completion_index()
+
+    results: list[Completion] = []
+    if kind in (None, "whp"):
+        folded, entries = index["whp"]
+        start, stop = _prefix_range(folded, prefix)
+        results.extend(
+            nsmallest(
+                limit,
+                entries[start:stop],
+                key=lambda c: (c.item.rank, c.text.casefold()),  # type: ignore[union-attr]
+            )
+        )
+    if kind in (None, "cf") and len(results) < limit:
+        folded, entries = index["cf"]
+        start, stop = _prefix_range(folded, prefix)
+        results.extend(entries[start : min(stop, start + limit - len(results))])
+    return results
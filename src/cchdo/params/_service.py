@@ -0,0 +1,337 @@
+"""A small asyncio HTTP/1.1 server for parameter lookups, used by the ``serve`` command
+
+Every endpoint answers GET requests with query parameters and POST requests with a JSON array body,
+the array form resolves many keys in one round trip.
+Connections are kept alive unless the client asks otherwise,
+and are closed if no request arrives within the idle timeout.
+
+``GET /resolve?key=CTDPRS [DBAR]`` and ``POST /resolve`` with ``["CTDPRS [DBAR]", ["CTDTMP", "ITS-90"]]``
+    :func:`resolve_record` for each key
+``GET /nc_attrs?key=CTDPRS [DBAR]&error=true`` and ``POST /nc_attrs`` with ``[{"key": "CTDPRS [DBAR]", "error": true}]``
+    :meth:`WHPName.get_nc_attrs` for each key
+``GET /search?q=pressure&limit=20&kind=whp`` and ``POST /search`` with ``[{"q": "pressure", "limit": 5}]``
+    :func:`cchdo.params.search` hits as ``{"score", "kind", "key"}`` objects
+``GET /complete?prefix=ctdpr&limit=10&kind=whp`` and ``POST /complete`` with ``[{"prefix": "ctdpr", "limit": 5}]``
+    :func:`cchdo.params.complete` results as ``{"text", "kind", "key"}`` objects
+``GET /legacy_json``
+    the cached legacy json document
+"""
+
+import asyncio
+import json
+from collections.abc import Callable
+from http import HTTPStatus
+from logging import getLogger
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qs, urlsplit
+
+from .core import WHPName
+
+if TYPE_CHECKING:
+    from . import _WHPNames
+
+_MAX_BODY = 16 * 1024 * 1024
+
+logger = getLogger(__name__)
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def column_nc_name(param: WHPName) -> str:
+    """The netCDF variable name of the column `param` was resolved from"""
+    if param.flag_col:
+        return param.nc_name_flag
+    if param.error_col:
+        return param.nc_name_error
+    return param.full_nc_name
+
+
+def resolve_record(whpnames: "_WHPNames", key) -> dict:
+    """Resolve `key` and describe the result as a JSON serializable dict
+
+    Failures are reported in the ``error`` member rather than raised.
+
+    >>> from cchdo.params import WHPNames
+    >>> resolve_record(WHPNames, "CTDPRS [DBARS]_FLAG_W")
+    {'input': 'CTDPRS [DBARS]_FLAG_W', 'key': 'CTDPRS [DBAR]_FLAG_W', 'whp_name': 'CTDPRS', 'whp_unit': 'DBAR', 'nc_name': 'pressure_qc', 'flag_col': True, 'error_col': False, 'alt_depth': 0, 'alias': ['CTDPRS', 'DBARS'], 'error': None}
+
+    :param key: anything :class:`WHPNames` accepts as a key, lists are treated as (name, unit) tuples
+    """
+    lookup = tuple(key) if isinstance(key, list) else key
+    try:
+        param = whpnames[lookup]
+    except (KeyError, ValueError) as err:
+        return {"input": key, "error": f"{type(err).__name__}: {err}"}
+
+    alias = None
+    if param.whp_name_alias is not None:
+        alias = [param.whp_name_alias, param.whp_unit_alias]
+    return {
+        "input": key,
+        "key": param.odv_key,
+        "whp_name": param.whp_name,
+        "whp_unit": param.whp_unit,
+        "nc_name": column_nc_name(param),
+        "flag_col": param.flag_col,
+        "error_col": param.error_col,
+        "alt_depth": param.alt_depth,
+        "alias": alias,
+        "error": None,
+    }
+
+
+def _nc_attrs(whpnames: "_WHPNames", request: dict) -> dict:
+    key = request["key"]
+    error = request.get("error", False)
+    if not isinstance(error, bool):
+        raise _HTTPError(
+            HTTPStatus.BAD_REQUEST, f'"error" must be true or false, not {error!r}'
+        )
+    try:
+        param = whpnames[tuple(key) if isinstance(key, list) else key]
+    except (KeyError, ValueError) as err:
+        return {"input": key, "error": f"{type(err).__name__}: {err}"}
+    return {
+        "input": key,
+        "attrs": param.get_nc_attrs(error=error),
+        "error": None,
+    }
+
+
+def _search(request: dict) -> list[dict]:
+    from . import search
+
+    kind = request.get("kind")
+    if kind not in (None, "whp", "cf"):
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, f"unknown search kind {kind!r}")
+    hits = search(request["q"], limit=int(request.get("limit", 20)), kind=kind)
+    return [{"score": hit.score, "kind": hit.kind, "key": hit.key} for hit in hits]
+
+
+def _complete(request: dict) -> list[dict]:
+    from . import complete
+
+    kind = request.get("kind")
+    if kind not in (None, "whp", "cf"):
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, f"unknown completion kind {kind!r}")
+    prefix = request["prefix"]
+    if not isinstance(prefix, str):
+        raise _HTTPError(
+            HTTPStatus.BAD_REQUEST, f"prefix must be a string, not {prefix!r}"
+        )
+    completions = complete(prefix, limit=int(request.get("limit", 20)), kind=kind)
+    return [{"text": c.text, "kind": c.kind, "key": c.key} for c in completions]
+
+
+def _truthy(value: str) -> bool:
+    return value.lower() in {"1", "true", "yes"}
+
+
+def _one(query: dict[str, list[str]], name: str) -> str:
+    if name not in query:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, f"missing query parameter {name!r}")
+    return query[name][0]
+
+
+class ParamsService:
+    """Dispatches parsed HTTP requests to the lookup functions
+
+    This is independent of the transport so it can be exercised without a socket.
+    """
+
+    def __init__(self, whpnames: "_WHPNames | None" = None, idle_timeout: float = 30.0):
+        """
+        :param idle_timeout: seconds to wait for the next request on a connection before closing it
+        """
+        if whpnames is None:
+            from . import WHPNames as whpnames
+        self.whpnames = whpnames
+        self.idle_timeout = idle_timeout
+        self._routes: dict[str, Callable[[str, dict, object], object]] = {
+            "/resolve": self._resolve,
+            "/nc_attrs": self._nc_attrs,
+            "/search": self._search,
+            "/complete": self._complete,
+        }
+
+    def warm(self) -> None:
+        """Build the lazily created indexes up front so the first requests are not slow"""
+        from ._search import _completion_index, _index
+
+        _index()
+        _completion_index()
+        self.whpnames.odv_names
+        self.whpnames.error_cols
+        # serializing this on the first request would block the event loop
+        self.whpnames.legacy_json_bytes
+
+    def _resolve(self, method, query, body):
+        if method == "GET":
+            return [resolve_record(self.whpnames, key) for key in query.get("key", [])]
+        return [resolve_record(self.whpnames, key) for key in body]
+
+    def _nc_attrs(self, method, query, body):
+        if method == "GET":
+            error = _truthy(query.get("error", ["false"])[0])
+            return [
+                _nc_attrs(self.whpnames, {"key": key, "error": error})
+                for key in query.get("key", [])
+            ]
+        return [
+            _nc_attrs(self.whpnames, req if isinstance(req, dict) else {"key": req})
+            for req in body
+        ]
+
+    def _search(self, method, query, body):
+        if method == "GET":
+            request = {name: values[0] for name, values in query.items()}
+            request["q"] = _one(query, "q")
+            return _search(request)
+        return [_search(req if isinstance(req, dict) else {"q": req}) for req in body]
+
+    def _complete(self, method, query, body):
+        if method == "GET":
+            request = {name: values[0] for name, values in query.items()}
+            request["prefix"] = query.get("prefix", [""])[0]
+            return _complete(request)
+        return [
+            _complete(req if isinstance(req, dict) else {"prefix": req}) for req in body
+        ]
+
+    def handle(self, method: str, target: str, body: bytes) -> tuple[HTTPStatus, bytes]:
+        """Answer a single request
+
+        :returns: the status and the JSON response body
+        """
+        url = urlsplit(target)
+        try:
+            if url.path == "/legacy_json":
+                if method != "GET":
+                    raise _HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "use GET")
+                return HTTPStatus.OK, self.whpnames.legacy_json_bytes
+
+            if (route := self._routes.get(url.path)) is None:
+                raise _HTTPError(HTTPStatus.NOT_FOUND, f"no endpoint {url.path}")
+
+            parsed = None
+            if method == "POST":
+                try:
+                    parsed = json.loads(body)
+                except ValueError as err:
+                    raise _HTTPError(HTTPStatus.BAD_REQUEST, str(err)) from err
+                if not isinstance(parsed, list):
+                    raise _HTTPError(
+                        HTTPStatus.BAD_REQUEST, "request body must be a JSON array"
+                    )
+            elif method != "GET":
+                raise _HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "use GET or POST")
+
+            result = route(method, parse_qs(url.query), parsed)
+        except _HTTPError as err:
+            return err.status, json.dumps({"error": str(err)}).encode()
+        except (KeyError, TypeError, ValueError) as err:
+            return HTTPStatus.BAD_REQUEST, json.dumps(
+                {"error": f"{type(err).__name__}: {err}"}
+            ).encode()
+        except Exception:
+            # anything else is a bug, but the client still gets a response and the connection survives
+            logger.exception("error handling %s %s", method, target)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, json.dumps(
+                {"error": "internal server error"}
+            ).encode()
+        return HTTPStatus.OK, json.dumps(result).encode()
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> tuple[str, str, str, dict[str, str], bytes] | None:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError as err:
+            raise _HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line") from err
+
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length > _MAX_BODY:
+            raise _HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, version, headers, body
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    try:
+                        request = await asyncio.wait_for(
+                            self._read_request(reader), self.idle_timeout
+                        )
+                    except TimeoutError:
+                        break
+                    if request is None:
+                        break
+                    method, target, version, headers, body = request
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = (
+                        connection != "close"
+                        if version == "HTTP/1.1"
+                        else connection == "keep-alive"
+                    )
+                    status, payload = self.handle(method, target, body)
+                except _HTTPError as err:
+                    status, payload = (
+                        err.status,
+                        json.dumps({"error": str(err)}).encode(),
+                    )
+                except (asyncio.IncompleteReadError, ValueError):
+                    status, payload = (
+                        HTTPStatus.BAD_REQUEST,
+                        b'{"error": "malformed request"}',
+                    )
+
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    "\r\n".encode("latin-1")
+                )
+                writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(
+        self, host: str = "127.0.0.1", port: int = 8000, unix: str | None = None
+    ) -> asyncio.Server:
+        """Start listening on a TCP `host` and `port`, or on the Unix socket path `unix`"""
+        if unix is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+async def serve(
+    host: str = "127.0.0.1", port: int = 8000, unix: str | None = None
+) -> None:
+    """Run the service until cancelled"""
+    service = ParamsService()
+    service.warm()
+    server = await service.start(host, port, unix)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,567 @@
+"""Surveys and indexes of the parameters used in directory trees of WHP Exchange files
+
+Only the parameter and unit lines of each file are read,
+``.csv`` files are read directly and every ``.csv`` member of a ``.zip`` file is read.
+Files are read in a process pool, the headers are then aggregated by fingerprint
+so each distinct header and each distinct (name, unit) column is only resolved once.
+:class:`ArchiveIndex` keeps the headers in SQLite so reruns only read the files that changed.
+"""
+
+import os
+import sqlite3
+import zipfile
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from io import TextIOWrapper
+from typing import IO, TYPE_CHECKING, NamedTuple
+
+from .core import WHPName
+from .header import _parse_header, canonical_header
+
+if TYPE_CHECKING:
+    from . import _WHPNames
+
+Header = tuple[tuple[str, str | None], ...]
+
+EXCHANGE_SUFFIXES = (".csv", ".zip")
+
+
+class FileHeaders(NamedTuple):
+    """The headers read from one file of the archive"""
+
+    path: str
+    #: pairs of (zip member name, header), the member name is ``None`` for plain csv files
+    headers: tuple[tuple[str | None, Header], ...]
+    #: why the file could not be read, ``None`` if it was
+    error: str | None = None
+
+
+def read_exchange_header(lines: Iterable[str]) -> Header:
+    """Read the canonical parameter and unit header from the lines of an Exchange file
+
+    Only the lines up to and including the units line are consumed.
+
+    >>> read_exchange_header(
+    ...     [
+    ...         "CTD,20240101CCHSIOABC\\n",
+    ...         "# a comment\\n",
+    ...         "NUMBER_HEADERS = 2\\n",
+    ...         "EXPOCODE = 33RR20160208\\n",
+    ...         "CTDPRS,CTDPRS_FLAG_W\\n",
+    ...         "DBAR,\\n",
+    ...         "1.0,2\\n",
+    ...     ]
+    ... )
+    (('CTDPRS', 'DBAR'), ('CTDPRS_FLAG_W', None))
+
+    :raises ValueError: if the lines end before the units line
+    """
+    it = iter(lines)
+    # the first line is the file type stamp
+    if next(it, None) is None:
+        raise ValueError("empty file")
+
+    header_lines: list[str] = []
+    for line in it:
+        if line.startswith("#"):
+            continue
+        if len(header_lines) == 0 and line.startswith("NUMBER_HEADERS"):
+            _, _, count = line.partition("=")
+            # the NUMBER_HEADERS line counts itself
+            for _ in range(int(count) - 1):
+                next(it)
+            continue
+        header_lines.append(line)
+        if len(header_lines) == 2:
+            return canonical_header(*header_lines)
+    raise ValueError("file ended before the parameter and unit lines")
+
+
+def _read_text_header(fp: IO[bytes]) -> Header:
+    return read_exchange_header(
+        TextIOWrapper(fp, encoding="utf-8-sig", errors="replace", newline=None)
+    )
+
+
+def read_file_headers(path: str | os.PathLike) -> FileHeaders:
+    """Read the header of an Exchange csv file, or of every csv in an Exchange zip file
+
+    Errors are recorded in the result rather than raised, so one bad file does not stop a survey.
+    """
+    path = os.fspath(path)
+    try:
+        if path.lower().endswith(".zip"):
+            headers = []
+            with zipfile.ZipFile(path) as zf:
+                for member in zf.infolist():
+                    if member.is_dir() or not member.filename.lower().endswith(".csv"):
+                        continue
+                    with zf.open(member) as fp:
+                        headers.append((member.filename, _read_text_header(fp)))
+            return FileHeaders(path, tuple(headers))
+
+        with open(path, "rb") as fp:
+            return FileHeaders(path, ((None, _read_text_header(fp)),))
+    except (OSError, ValueError, StopIteration, zipfile.BadZipFile) as err:
+        return FileHeaders(path, (), f"{type(err).__name__}: {err}")
+
+
+def walk_exchange_files(paths: Iterable[str | os.PathLike]) -> Iterator[str]:
+    """Yield every Exchange csv and zip file in `paths`, directories are walked recursively"""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield os.fspath(path)
+            continue
+        for root, dirs, filenames in os.walk(path):
+            dirs.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(EXCHANGE_SUFFIXES):
+                    yield os.path.join(root, filename)
+
+
+def iter_file_headers(
+    files: Iterable[str], max_workers: int | None = None, chunksize: int = 64
+) -> Iterator[FileHeaders]:
+    """Read the headers of `files` in a process pool, yielding results in the order of `files`
+
+    :param max_workers: number of processes, defaults to the number of cpus, 1 reads in this process
+    """
+    if max_workers == 1:
+        yield from map(read_file_headers, files)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(read_file_headers, files, chunksize=chunksize)
+
+
+def header_lookup_keys(header: Header) -> Iterator[tuple[str, str | None]]:
+    """The (name, unit) key used to look up each column of `header`
+
+    Flag columns without units use the units of their data column.
+
+    >>> list(header_lookup_keys((("CTDPRS", "DBAR"), ("CTDPRS_FLAG_W", None))))
+    [('CTDPRS', 'DBAR'), ('CTDPRS_FLAG_W', 'DBAR')]
+    """
+    units: dict[str, str | None] = {}
+    for name, unit in header:
+        if name.endswith("_FLAG_W"):
+            if unit is None:
+                unit = units.get(name.removesuffix("_FLAG_W"))
+        else:
+            units[name] = unit
+        yield name, unit
+
+
+def survey(
+    paths: Iterable[str | os.PathLike],
+    whpnames: "_WHPNames | None" = None,
+    max_workers: int | None = None,
+) -> dict:
+    """Survey the parameters used by all the Exchange files in `paths`
+
+    :param paths: files and directories to survey, directories are walked recursively
+    :param whpnames: the registry to resolve against, defaults to :data:`cchdo.params.WHPNames`
+    :param max_workers: see :func:`iter_file_headers`
+    :returns: a JSON serializable report, ``params`` has one entry per distinct (name, unit) column as written
+              with the number of headers it appears in, the ``key`` it resolved to, the ``alias`` used, and ``error`` if it did not resolve.
+              Headers are resolved with :func:`cchdo.params.header.parse_header`,
+              ``invalid_headers`` lists those it rejects (e.g. a flag column before its data column), their columns are not counted.
+              ``unreadable`` lists the files that could not be read.
+    """
+    if whpnames is None:
+        from . import WHPNames as whpnames
+
+    file_count = 0
+    headers: Counter[Header] = Counter()
+    unreadable = []
+    for result in iter_file_headers(walk_exchange_files(paths), max_workers):
+        file_count += 1
+        if result.error is not None:
+            unreadable.append({"path": result.path, "error": result.error})
+        headers.update(header for _, header in result.headers)
+
+    columns: Counter[tuple[str, str | None]] = Counter()
+    resolved: dict[tuple[str, str | None], WHPName] = {}
+    errors: dict[tuple[str, str | None], str] = {}
+    invalid_headers = []
+    for header, count in headers.items():
+        unknown: list[tuple[int, str, str | None, str]] = []
+        try:
+            parsed = _parse_header(whpnames, header, False, unknown)
+        except ValueError as err:
+            invalid_headers.append(
+                {
+                    "params": [name for name, _ in header],
+                    "units": [unit for _, unit in header],
+                    "count": count,
+                    "error": f"ValueError: {err}",
+                }
+            )
+            continue
+        for column in parsed:
+            columns[(column.name, column.unit)] += count
+            resolved[(column.name, column.unit)] = column.param
+        for _, name, unit, error in unknown:
+            columns[(name, unit)] += count
+            errors[(name, unit)] = error
+
+    params = []
+    for key, count in columns.most_common():
+        name, unit = key
+        record: dict = {"name": name, "unit": unit, "count": count}
+        if (param := resolved.get(key)) is None:
+            record.update(key=None, alias=None, error=errors[key])
+        else:
+            alias = None
+            if param.whp_name_alias is not None:
+                alias = [param.whp_name_alias, param.whp_unit_alias]
+            record.update(key=param.odv_key, alias=alias, error=None)
+        params.append(record)
+
+    return {
+        "files": file_count,
+        "headers": headers.total(),
+        "distinct_headers": len(headers),
+        "unresolved": sum(1 for record in params if record["error"] is not None),
+        "params": params,
+        "invalid_headers": invalid_headers,
+        "unreadable": unreadable,
+    }
+
+
+# bumped when the tables change, an index with a different version is rebuilt
+_INDEX_VERSION = "2"
+_INDEX_DROP = """
+DROP TABLE IF EXISTS columns;
+DROP TABLE IF EXISTS resolved;
+DROP TABLE IF EXISTS files;
+DELETE FROM meta;
+"""
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS columns (
+    path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+    member TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    written_unit TEXT NOT NULL,
+    PRIMARY KEY (path, member, position)
+);
+CREATE INDEX IF NOT EXISTS columns_name_unit ON columns (name, unit);
+CREATE INDEX IF NOT EXISTS columns_name_written_unit ON columns (name, written_unit);
+CREATE TABLE IF NOT EXISTS resolved (
+    name TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    key TEXT,
+    whp_name TEXT,
+    whp_unit TEXT,
+    alias INTEGER,
+    error TEXT,
+    PRIMARY KEY (name, unit)
+);
+CREATE INDEX IF NOT EXISTS resolved_whp ON resolved (whp_name, whp_unit);
+CREATE INDEX IF NOT EXISTS resolved_unit ON resolved (whp_unit);
+"""
+
+
+class IndexHit(NamedTuple):
+    """A column of an archive file found by :meth:`ArchiveIndex.query`"""
+
+    path: str
+    #: the zip member the column is in, ``None`` for plain csv files
+    member: str | None
+    position: int
+    #: the column name as written
+    name: str
+    #: the unit the column was looked up with, flags without units have those of their data column
+    unit: str | None
+    #: the ODV key of the parameter the column resolved to
+    key: str
+    alias: bool
+    #: the unit as written in the file
+    written_unit: str | None
+
+
+def _hash_file_headers(
+    task: tuple[str, str | None],
+) -> tuple[str, int, int, str, FileHeaders | None]:
+    """Stat and hash a file, its headers are only read if the hash differs from the known one"""
+    path, known_sha256 = task
+    try:
+        stat = os.stat(path)
+        digest = sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+    except OSError as err:
+        return path, 0, 0, "", FileHeaders(path, (), f"{type(err).__name__}: {err}")
+    hexdigest = digest.hexdigest()
+    headers = None if hexdigest == known_sha256 else read_file_headers(path)
+    return path, stat.st_mtime_ns, stat.st_size, hexdigest, headers
+
+
+def _registry_digest(whpnames: "_WHPNames") -> str:
+    digest = sha256()
+    for key in sorted(map(str, whpnames.keys())):
+        digest.update(key.encode())
+    for alias in sorted(map(str, whpnames._aliases.items())):
+        digest.update(alias.encode())
+    return digest.hexdigest()
+
+
+class ArchiveIndex:
+    """A persistent SQLite index of which archive files use which parameters
+
+    The raw header of every file is stored, keyed by path along with its mtime, size, and sha256.
+    :meth:`update` only reads files whose mtime or size changed, and only re-reads the header when the content hash changed.
+    Columns are resolved once per distinct (name, unit) and re-resolved if the parameter registry changes.
+
+    :param path: the sqlite database file, created if it does not exist
+    :param whpnames: the registry to resolve against, defaults to :data:`cchdo.params.WHPNames`
+    """
+
+    def __init__(
+        self, path: str | os.PathLike, whpnames: "_WHPNames | None" = None
+    ) -> None:
+        if whpnames is None:
+            from . import WHPNames as whpnames
+        self.whpnames = whpnames
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        version = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()
+        has_tables = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name IN ('files', 'columns')"
+        ).fetchone()
+        # indexes from before the version was recorded have tables but no version
+        stale = version[0] != _INDEX_VERSION if version else has_tables is not None
+        if stale:
+            self.conn.executescript(_INDEX_DROP)
+        self.conn.executescript(_INDEX_SCHEMA)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)", (_INDEX_VERSION,)
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "ArchiveIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _store(self, path: str, mtime_ns: int, size: int, sha: str, headers) -> None:
+        conn = self.conn
+        conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        conn.execute(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+            (path, mtime_ns, size, sha, headers.error),
+        )
+        conn.executemany(
+            "INSERT INTO columns VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (path, member or "", position, name, unit or "", written_unit or "")
+                for member, header in headers.headers
+                for position, ((name, unit), (_, written_unit)) in enumerate(
+                    zip(header_lookup_keys(header), header, strict=True)
+                )
+            ),
+        )
+
+    def _resolve(self) -> None:
+        registry = _registry_digest(self.whpnames)
+        stored = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'registry'"
+        ).fetchone()
+        if stored is None or stored[0] != registry:
+            self.conn.execute("DELETE FROM resolved")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('registry', ?)", (registry,)
+            )
+
+        pending = self.conn.execute(
+            "SELECT DISTINCT name, unit FROM columns "
+            "EXCEPT SELECT name, unit FROM resolved"
+        ).fetchall()
+        rows = []
+        for name, unit in pending:
+            try:
+                param = self.whpnames[(name, unit or None)]
+            except (KeyError, ValueError) as err:
+                rows.append(
+                    (name, unit, None, None, None, None, f"{type(err).__name__}: {err}")
+                )
+                continue
+            rows.append(
+                (
+                    name,
+                    unit,
+                    param.odv_key,
+                    param.whp_name,
+                    param.whp_unit or "",
+                    param.whp_name_alias is not None,
+                    None,
+                )
+            )
+        self.conn.executemany("INSERT INTO resolved VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def update(
+        self,
+        paths: Iterable[str | os.PathLike],
+        max_workers: int | None = None,
+        prune: bool = True,
+    ) -> dict[str, int]:
+        """Bring the index up to date with the Exchange files in `paths`
+
+        :param paths: files and directories to index, directories are walked recursively
+        :param max_workers: see :func:`iter_file_headers`
+        :param prune: remove indexed files under `paths` which no longer exist
+        :returns: counts of the ``unchanged``, ``touched`` (mtime changed but not content), ``updated``, and ``removed`` files
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        known = {
+            path: (mtime_ns, size, sha)
+            for path, mtime_ns, size, sha in self.conn.execute(
+                "SELECT path, mtime_ns, size, sha256 FROM files"
+            )
+        }
+        stats = dict.fromkeys(("unchanged", "touched", "updated", "removed"), 0)
+
+        seen = set()
+        tasks = []
+        for path in walk_exchange_files(paths):
+            seen.add(path)
+            stored = known.get(path)
+            if stored is not None:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    stat = None
+                if stat is not None and (stat.st_mtime_ns, stat.st_size) == stored[:2]:
+                    stats["unchanged"] += 1
+                    continue
+            tasks.append((path, None if stored is None else stored[2]))
+
+        def hashed():
+            if max_workers == 1:
+                yield from map(_hash_file_headers, tasks)
+                return
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                yield from executor.map(_hash_file_headers, tasks, chunksize=64)
+
+        with self.conn:
+            for path, mtime_ns, size, sha, headers in hashed():
+                if headers is None:
+                    stats["touched"] += 1
+                    self.conn.execute(
+                        "UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?",
+                        (mtime_ns, size, path),
+                    )
+                    continue
+                stats["updated"] += 1
+                self._store(path, mtime_ns, size, sha, headers)
+
+            if prune:
+                roots = tuple(path.rstrip(os.sep) + os.sep for path in paths)
+                removed = [
+                    (path,)
+                    for path in known
+                    if path not in seen and (path in paths or path.startswith(roots))
+                ]
+                self.conn.executemany("DELETE FROM files WHERE path = ?", removed)
+                stats["removed"] = len(removed)
+
+            self._resolve()
+        return stats
+
+    def query(
+        self,
+        param: str | None = None,
+        unit: str | None = None,
+        alias: bool | None = None,
+        name: str | None = None,
+        written_unit: str | None = None,
+    ) -> list[IndexHit]:
+        """Find the columns of indexed files which resolved to matching parameters
+
+        To find which files wrote a particular alias, e.g. ``CTDPRS [DBARS]``,
+        filter on the name and unit as written:
+
+        >>> ArchiveIndex(":memory:").query(name="CTDPRS", written_unit="DBARS")
+        []
+
+        :param param: the canonical whp_name of the parameter
+        :param unit: the canonical whp_unit of the parameter, use ``""`` for unitless parameters
+        :param alias: if True only columns that used an alias, if False only columns that did not
+        :param name: the column name as written, e.g. ``CTDPRS_FLAG_W``
+        :param written_unit: the unit as written, use ``""`` for columns without a unit
+        """
+        sql = (
+            "SELECT columns.path, member, position, columns.name, columns.unit, key, alias, written_unit "
+            "FROM resolved JOIN columns USING (name, unit) WHERE error IS NULL"
+        )
+        params: list = []
+        if param is not None:
+            sql += " AND whp_name = ?"
+            params.append(param)
+        if unit is not None:
+            sql += " AND whp_unit = ?"
+            params.append(unit)
+        if alias is not None:
+            sql += " AND alias = ?"
+            params.append(alias)
+        if name is not None:
+            sql += " AND columns.name = ?"
+            params.append(name)
+        if written_unit is not None:
+            sql += " AND written_unit = ?"
+            params.append(written_unit)
+        sql += " ORDER BY columns.path, member, position"
+        return [
+            IndexHit(
+                path,
+                member or None,
+                position,
+                column_name,
+                column_unit or None,
+                key,
+                bool(column_alias),
+                column_written_unit or None,
+            )
+            for (
+                path,
+                member,
+                position,
+                column_name,
+                column_unit,
+                key,
+                column_alias,
+                column_written_unit,
+            ) in self.conn.execute(sql, params)
+        ]
+
+    def unresolved(self) -> list[tuple[str, str | None, str, int]]:
+        """The distinct (name, unit) columns that did not resolve, with the error and how many columns use them"""
+        return [
+            (name, unit or None, error, count)
+            for name, unit, error, count in self.conn.execute(
+                "SELECT name, unit, error, count(*) FROM resolved JOIN columns USING (name, unit) "
+                "WHERE error IS NOT NULL GROUP BY name, unit ORDER BY 4 DESC, name, unit"
+            )
+        ]
@@ -0,0 +1,340 @@
+"""Vectorized helpers for reading and writing Exchange data columns with numpy
+
+Exchange files write dates as ``YYYYMMDD`` and times as ``HHMM``, see :meth:`WHPName.strfex`.
+The decoders accept arrays of ``str`` or ``bytes`` and return masked arrays,
+values which are not valid dates or times are masked rather than raising.
+
+:func:`scan_precision` finds the number of decimal places used in the raw strings of a column,
+so a file can be rewritten with the precision it was submitted with.
+:func:`required_width` finds the width a column needs so every value can be formatted in a single pass.
+
+This module requires numpy, install the ``numpy`` extra.
+"""
+
+from collections.abc import Iterable, Mapping
+from typing import NamedTuple
+
+from .core import WHPName
+
+try:
+    import numpy as np
+except ImportError as err:  # pragma: no cover
+    raise ImportError(
+        "cchdo.params.arrays requires numpy, install cchdo.params[numpy]"
+    ) from err
+
+_EPOCH_DAY = np.datetime64(0, "D")
+
+
+def _as_strings(values):
+    """`values` as a numpy str or bytes array, object arrays of str and bytes are converted to str"""
+    arr = np.asarray(values)
+    if arr.dtype.kind == "O":
+        arr = np.array(
+            [
+                value.decode("ascii", "replace")
+                if isinstance(value, bytes)
+                else str(value)
+                for value in arr.ravel()
+            ],
+            dtype=str,
+        ).reshape(arr.shape)
+    if arr.dtype.kind not in "US":
+        raise TypeError(f"expected an array of str or bytes, got {arr.dtype}")
+    return arr
+
+
+def _digits(values, width: int):
+    """The digits of each fixed `width` string in `values`
+
+    :returns: an (n, width) int array of the digits, a boolean array of which values are exactly `width` digits,
+              and the shape of `values`
+    """
+    arr = _as_strings(values)
+    shape = arr.shape
+    arr = np.char.strip(arr.ravel())
+    length = np.char.str_len(arr)
+    if arr.dtype.kind == "U":
+        codes = arr.astype(f"U{width}").view(np.uint32)
+    else:
+        codes = arr.astype(f"S{width}").view(np.uint8)
+    digits = codes.reshape(-1, width).astype(np.int64) - ord("0")
+    valid = (length == width) & np.all((digits >= 0) & (digits <= 9), axis=1)
+    return np.where(valid[:, np.newaxis], digits, 0), valid, shape
+
+
+def _number(digits) -> np.ndarray:
+    return digits @ (10 ** np.arange(digits.shape[1] - 1, -1, -1))
+
+
+def decode_dates(values) -> np.ma.MaskedArray:
+    """Convert ``YYYYMMDD`` strings or bytes to a masked ``datetime64[D]`` array
+
+    >>> dates = decode_dates(["20200229", b"20210229", "2020-01-01", " 19991231 "])
+    >>> dates.mask
+    array([False,  True,  True, False])
+    >>> dates.filled()
+    array(['2020-02-29',        'NaT',        'NaT', '1999-12-31'],
+          dtype='datetime64[D]')
+    """
+    digits, valid, shape = _digits(values, 8)
+    year = _number(digits[:, :4])
+    month = _number(digits[:, 4:6])
+    day = _number(digits[:, 6:])
+    valid &= (month >= 1) & (month <= 12) & (day >= 1)
+
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype("M8[M]")
+    first = months.astype("M8[D]")
+    days_in_month = ((months + np.timedelta64(1, "M")).astype("M8[D]") - first).astype(
+        np.int64
+    )
+    valid &= day <= days_in_month
+
+    dates = np.where(
+        valid, first + (day - 1).astype("m8[D]"), np.datetime64("NaT", "D")
+    )
+    return np.ma.masked_array(dates.reshape(shape), mask=~valid.reshape(shape))
+
+
+def decode_times(values) -> np.ma.MaskedArray:
+    """Convert ``HHMM`` strings or bytes to a masked ``timedelta64[m]`` array of the time since midnight
+
+    >>> decode_times(["0000", "2359", "2400", "930"]).filled()
+    array([    0,  1439, 'NaT', 'NaT'], dtype='timedelta64[m]')
+    """
+    digits, valid, shape = _digits(values, 4)
+    hour = _number(digits[:, :2])
+    minute = _number(digits[:, 2:])
+    valid &= (hour <= 23) & (minute <= 59)
+
+    times = np.where(
+        valid, (hour * 60 + minute).astype("m8[m]"), np.timedelta64("NaT", "m")
+    )
+    return np.ma.masked_array(times.reshape(shape), mask=~valid.reshape(shape))
+
+
+def combine_datetimes(dates, times) -> np.ma.MaskedArray:
+    """Combine decoded dates and times into a masked ``datetime64[m]`` array
+
+    A timestamp is masked if either its date or time is.
+
+    >>> dates = decode_dates(["20200101", "20200101"])
+    >>> combine_datetimes(dates, decode_times(["1230", "99"])).filled()
+    array(['2020-01-01T12:30',              'NaT'], dtype='datetime64[m]')
+    """
+    mask = np.ma.getmaskarray(dates) | np.ma.getmaskarray(times)
+    combined = np.ma.getdata(dates).astype("M8[m]") + np.ma.getdata(times).astype(
+        "m8[m]"
+    )
+    return np.ma.masked_array(
+        np.where(mask, np.datetime64("NaT", "m"), combined), mask=mask
+    )
+
+
+def _bad(values, data) -> np.ndarray:
+    return np.ma.getmaskarray(values) | np.isnat(data)
+
+
+def encode_dates(dates, fill: str = "-999") -> np.ndarray:
+    """Format datetimes as ``YYYYMMDD`` strings, masked and NaT values become `fill`
+
+    >>> encode_dates(np.array(["2020-02-29T13:45", "NaT"], dtype="M8[m]"))
+    array(['20200229', '-999'], dtype='<U8')
+    """
+    data = np.asarray(np.ma.getdata(dates)).astype("M8[D]")
+    bad = _bad(dates, data)
+    safe = np.where(bad, _EPOCH_DAY, data)
+    months = safe.astype("M8[M]")
+    year = safe.astype("M8[Y]").astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (safe - months.astype("M8[D]")).astype(np.int64) + 1
+    text = np.char.zfill((year * 10000 + month * 100 + day).astype("U8"), 8)
+    return np.where(bad, fill, text)
+
+
+def encode_times(times, fill: str = "-999") -> np.ndarray:
+    """Format times as ``HHMM`` strings, masked and NaT values become `fill`
+
+    `times` may be ``timedelta64`` since midnight or ``datetime64``, in which case the time of day is used.
+    Seconds are truncated.
+
+    >>> encode_times(np.array(["2020-02-29T13:45:59", "NaT"], dtype="M8[s]"))
+    array(['1345', '-999'], dtype='<U4')
+    """
+    data = np.asarray(np.ma.getdata(times))
+    if data.dtype.kind == "M":
+        data = data - data.astype("M8[D]")
+    data = data.astype("m8[m]")
+    bad = _bad(times, data)
+    minutes = np.where(bad, 0, data.astype(np.int64))
+    hhmm = (minutes // 60) * 100 + minutes % 60
+    return np.where(bad, fill, np.char.zfill(hhmm.astype("U4"), 4))
+
+
+class ColumnPrecision(NamedTuple):
+    """The decimal places used by the values of a column, see :func:`scan_precision`"""
+
+    #: the most decimal places of any value, ``None`` if there were no numeric values
+    max_decimals: int | None
+    #: mapping of number of decimal places to how many values had that many
+    counts: dict[int, int]
+    #: how many fill (-999) values were skipped
+    fill: int
+    #: how many values were not plain decimal numbers (e.g. empty or exponent notation)
+    invalid: int
+
+
+def scan_precision(values) -> ColumnPrecision:
+    """Count the decimal places written in each raw string value of a column
+
+    Fill values, anything equal to -999, are not counted since they are written with no decimals regardless of the column.
+
+    >>> scan_precision(["1.25", " 3.5", "-999", "10", "-999.0000", "NaN", "-0.125", "--5"])
+    ColumnPrecision(max_decimals=3, counts={0: 1, 1: 1, 2: 1, 3: 1}, fill=2, invalid=2)
+    """
+    arr = np.char.strip(_as_strings(values).ravel())
+    dot = b"." if arr.dtype.kind == "S" else "."
+    signs = b"+-" if arr.dtype.kind == "S" else "+-"
+
+    unpointed = np.char.replace(arr, dot, arr.dtype.type(""), count=1)
+    digits = np.char.lstrip(unpointed, signs)
+    # isdecimal rather than isdigit, which includes characters like superscripts that float() rejects
+    valid = (
+        np.char.isdigit(digits) if arr.dtype.kind == "S" else np.char.isdecimal(digits)
+    )
+    # at most one leading sign, "--5" and "+-1" are not numbers
+    valid &= np.char.str_len(unpointed) - np.char.str_len(digits) <= 1
+    numbers = np.where(valid, arr, arr.dtype.type("0")).astype(float)
+    fill = valid & (numbers == -999)
+    counted = valid & ~fill
+
+    point = np.char.find(arr, dot)
+    decimals = np.where(point >= 0, np.char.str_len(arr) - point - 1, 0)[counted]
+
+    counts = np.bincount(decimals) if decimals.size else np.zeros(0, dtype=int)
+    return ColumnPrecision(
+        max_decimals=int(decimals.max()) if decimals.size else None,
+        counts={places: int(n) for places, n in enumerate(counts) if n},
+        fill=int(fill.sum()),
+        invalid=int((~valid).sum()),
+    )
+
+
+def precision_overrides(
+    columns: Iterable[tuple[WHPName, object]], changed_only: bool = True
+) -> dict[int, int]:
+    """Scan the raw values of decimal data columns and build a ``numeric_precision_override`` map
+
+    Columns are given as (param, values) pairs in column order and the result is keyed by column position,
+    a mapping keyed by parameter cannot be used since flag and error columns compare equal to their data column.
+    The result is meant to be used with :meth:`WHPName.formatter` or :meth:`WHPName.strfex`:
+    ``param.formatter(numeric_precision_override=overrides.get(position))``.
+    Flag columns, columns which are not decimal, and columns with no numeric values are skipped.
+
+    >>> from cchdo.params.header import parse_header
+    >>> header = parse_header("CTDPRS,CTDPRS_FLAG_W", "DBAR,")
+    >>> header[0].param.numeric_precision
+    1
+    >>> values = [["1.25", "2.5"], ["2", "2"]]
+    >>> precision_overrides((column.param, values[column.index]) for column in header)
+    {0: 2}
+
+    :param columns: each column's parameter and an array of its raw string values
+    :param changed_only: only include columns whose scanned precision differs from the parameter's ``numeric_precision``
+    """
+    overrides = {}
+    for position, (param, values) in enumerate(columns):
+        if param.dtype != "decimal" or param.flag_col:
+            continue
+        max_decimals = scan_precision(values).max_decimals
+        if max_decimals is None:
+            continue
+        if changed_only and max_decimals == param.numeric_precision:
+            continue
+        overrides[position] = max_decimals
+    return overrides
+
+
+def required_width(
+    param: WHPName, values, numeric_precision_override: int | None = None
+) -> int:
+    """The field width needed to format every value of `values` without overflowing
+
+    This is never less than ``param.field_width``.
+    For numeric columns only the extreme values are formatted, the longest result is always one of them.
+
+    >>> from cchdo.params import WHPNames
+    >>> ctdprs = WHPNames["CTDPRS [DBAR]"]
+    >>> ctdprs.field_width
+    9
+    >>> required_width(ctdprs, np.array([1.0, 123456789.0, np.nan]))
+    11
+    >>> required_width(ctdprs, np.array([1.0, 2.0]))
+    9
+
+    :param values: a numeric array for decimal and integer columns, NaN is fill; an array of str otherwise
+    :param numeric_precision_override: the precision that will be used for a decimal column
+    """
+    if param.dtype == "string":
+        arr = np.asarray(values, dtype=str).ravel()
+        lengths = np.char.str_len(arr)
+        # blank values are written as -999
+        lengths[np.char.str_len(np.char.strip(arr)) == 0] = len("-999")
+        return int(max(param.field_width, lengths.max(initial=0)))
+
+    arr = np.asarray(values, dtype=float).ravel()
+    finite = arr[np.isfinite(arr)]
+    widths = [param.field_width]
+    if finite.size != arr.size:
+        widths.append(len("-999"))
+    if finite.size == 0:
+        return max(widths)
+
+    if param.dtype == "integer":
+        extremes = [int(finite.min()), int(finite.max())]
+        spec = "d"
+    else:
+        precision = param.numeric_precision
+        if numeric_precision_override is not None:
+            precision = numeric_precision_override
+        negative = finite[np.signbit(finite)]
+        # the most negative value, -0.0 is included since it formats with a sign
+        extremes = [finite.max()] + ([negative.min()] if negative.size else [])
+        spec = f".{precision}f"
+    widths.extend(len(format(value, spec)) for value in extremes)
+    return max(widths)
+
+
+def field_widths(
+    columns: Iterable[tuple[WHPName, object]],
+    numeric_precision_overrides: Mapping[int, int] | None = None,
+    changed_only: bool = True,
+) -> dict[int, int]:
+    """Compute :func:`required_width` for each data column and build a ``field_width_override`` map
+
+    Like :func:`precision_overrides`, columns are (param, values) pairs in column order and the result is keyed by column position.
+    It is meant to be used with :meth:`WHPName.formatter` or :meth:`WHPName.strfex`:
+    ``param.formatter(field_width_override=widths.get(position))``.
+    Flag columns are skipped, flags are not padded.
+
+    >>> from cchdo.params.header import parse_header
+    >>> header = parse_header("CTDPRS,CTDPRS_FLAG_W", "DBAR,")
+    >>> values = [np.array([1.0, 123456789.0]), np.array([2.0, 2.0])]
+    >>> field_widths((column.param, values[column.index]) for column in header)
+    {0: 11}
+
+    :param columns: each column's parameter and an array of its values
+    :param numeric_precision_overrides: the precisions that will be used by column position, e.g. from :func:`precision_overrides`
+    :param changed_only: only include columns which need more than the parameter's ``field_width``
+    """
+    if numeric_precision_overrides is None:
+        numeric_precision_overrides = {}
+    widths = {}
+    for position, (param, values) in enumerate(columns):
+        if param.flag_col:
+            continue
+        width = required_width(param, values, numeric_precision_overrides.get(position))
+        if changed_only and width == param.field_width:
+            continue
+        widths[position] = width
+    return widths
@@ -1,7 +1,77 @@
+from collections.abc import Callable
 from dataclasses import dataclass, field, replace
 from datetime import date, time
+from functools import cache
 from math import isnan
-from typing import Literal
+from typing import Any, Literal
+
+
+def _format_flag(value) -> str:
+    if isnan(value):
+        return "9"
+    return f"{int(value):d}"
+
+
+@cache
+def _compile_formatter(
+    dtype: str,
+    field_width: int,
+    numeric_precision: int | None,
+    flag: bool,
+    date_or_time: Literal["date", "time"] | None,
+) -> Callable[[Any], str]:
+    """Build a formatter equivalent to :meth:`WHPName.strfex` with every branch that does not depend on the value resolved"""
+    if flag:
+        return _format_flag
+
+    if dtype == "string":
+        if date_or_time == "date":
+            return "{:%Y%m%d}".format
+        if date_or_time == "time":
+
+            def format_time(value) -> str:
+                # strfex checks for dates (and so datetimes) before the requested kind
+                if isinstance(value, date):
+                    return f"{value:%Y%m%d}"
+                return f"{value:%H%M}"
+
+            return format_time
+
+        string_spec = f"{field_width}s"
+        string_fill = format("-999", string_spec)
+
+        def format_string(value) -> str:
+            if isinstance(value, date):
+                return f"{value:%Y%m%d}"
+            if isinstance(value, time):
+                return f"{value:%H%M}"
+            formatted = format(str(value), string_spec)
+            if formatted.strip() == "":
+                return string_fill
+            return formatted
+
+        return format_string
+
+    if dtype == "integer":
+        int_spec = f"{field_width}d"
+        int_fill = format(-999, int_spec)
+
+        def format_integer(value) -> str:
+            if isnan(value):
+                return int_fill
+            return format(int(value), int_spec)
+
+        return format_integer
+
+    float_spec = f"{field_width}.{numeric_precision}f"
+    float_fill = format(-999, f"{field_width}.0f")
+
+    def format_float(value) -> str:
+        if isnan(value):
+            return float_fill
+        return format(value, float_spec)
+
+    return format_float
 
 
 @dataclass(frozen=True)
@@ -289,12 +359,41 @@ class WHPName:
 
         return attrs
 
+    def formatter(
+        self,
+        numeric_precision_override: int | None = None,
+        flag: bool = False,
+        date_or_time: Literal["date", "time"] | None = None,
+        field_width_override: int | None = None,
+    ) -> Callable[[Any], str]:
+        """A function that formats single values exactly like :meth:`strfex` called with the same arguments
+
+        The formatting choices that do not depend on the value are made once, so this is the faster option
+        when formatting many values of the same column, formatters are cached and shared.
+
+        >>> fmt = WHPName("CTDPRS", "pressure", None, 1.0, "decimal", True, 9, numeric_precision=1).formatter()
+        >>> fmt(1234.56)
+        '   1234.6'
+        >>> fmt(float("nan"))
+        '     -999'
+        """
+        numeric_precision = self.numeric_precision
+        if numeric_precision_override is not None:
+            numeric_precision = numeric_precision_override
+        field_width = self.field_width
+        if field_width_override is not None:
+            field_width = field_width_override
+        return _compile_formatter(
+            self.dtype, field_width, numeric_precision, flag, date_or_time
+        )
+
     def strfex(
         self,
         value,
         flag: bool = False,
         numeric_precision_override: int | None = None,
         date_or_time: Literal["date", "time"] | None = None,
+        field_width_override: int | None = None,
     ) -> str:
         """Format a value using standard WHP Exchange conventions:
 
@@ -309,6 +408,8 @@ class WHPName:
         :param boolean flag: should `value` be interpreted as a WOCE flag
         :param int numeric_precision_override: if not None, will overrride the builtin databases :class:`WHPName.numeric_precision`
                                                when formatting floats
+        :param int field_width_override: if not None, will override :class:`WHPName.field_width`,
+                                         e.g. with a width computed from the data so wide values do not misalign the column
 
         :returns: `value` as a string for printing in a WHP Exchange file
         :rtype: str
@@ -318,29 +419,33 @@ class WHPName:
         elif flag is True:
             return "9"
 
+        field_width = self.field_width
+        if field_width_override is not None:
+            field_width = field_width_override
+
         # https://github.com/python/mypy/issues/5485
         if self.dtype == "string":
             if isinstance(value, date) or date_or_time == "date":
                 return f"{value:%Y%m%d}"
             if isinstance(value, time) or date_or_time == "time":
                 return f"{value:%H%M}"
-            formatted = f"{str(value):{self.field_width}s}"
+            formatted = f"{str(value):{field_width}s}"
             # having empty cells is undesireable
             if formatted.strip() == "":
-                return f"{'-999':{self.field_width}s}"
+                return f"{'-999':{field_width}s}"
 
             return formatted
         if self.dtype == "integer":
             if isnan(value):
-                return f"{-999:{self.field_width}d}"
-            return f"{int(value):{self.field_width}d}"
+                return f"{-999:{field_width}d}"
+            return f"{int(value):{field_width}d}"
 
         # we must have a float
         if isnan(value):
-            return f"{-999:{self.field_width}.0f}"
+            return f"{-999:{field_width}.0f}"
 
         numeric_precision = self.numeric_precision
         if numeric_precision_override is not None:
             numeric_precision = numeric_precision_override
 
-        return f"{value:{self.field_width}.{numeric_precision}f}"
+        return f"{value:{field_width}.{numeric_precision}f}"
@@ -1,9 +1,22 @@
-from collections.abc import MutableMapping
+from collections.abc import Container, Iterator, Mapping, MutableMapping
 from contextlib import contextmanager
-from importlib.resources import path
+from functools import cache
+from importlib.resources import files
+from pathlib import Path
 from textwrap import dedent
-
-from sqlalchemy import Enum, ForeignKey, ForeignKeyConstraint, Text, create_engine
+from urllib.parse import quote
+from xml.etree.ElementTree import iterparse
+
+from sqlalchemy import (
+    Engine,
+    Enum,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Text,
+    create_engine,
+    event,
+    text,
+)
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import (
     DeclarativeBase,
@@ -18,19 +31,77 @@ from sqlalchemy.orm.exc import NoResultFound
 from . import CFStandardName as CFStandardNameDC
 from . import WHPName as WHPNameDC
 
+# The database is rebuilt from the git tracked dump if anything goes wrong,
+# so durability is traded for speed during bulk maintenance
+_MAINTENANCE_PRAGMAS = (
+    "PRAGMA journal_mode=MEMORY",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+)
+_READONLY_PRAGMAS = (
+    "PRAGMA query_only=ON",
+    "PRAGMA cache_size=-65536",
+)
+
+
+def database_path() -> Path:
+    """The filesystem path of the params sqlite database"""
+    return Path(str(files("cchdo.params").joinpath("params.sqlite3")))
+
+
+def get_engine(readonly: bool = False) -> Engine:
+    """Get the pooled engine for the params database, this is created once per process
+
+    :param readonly: if True, open the database using a read only ``mode=ro`` URI,
+                     writes through this engine fail but changes made by other connections are still seen.
+    """
+    return _get_engine(bool(readonly))
+
+
+# get_engine() and get_engine(readonly=False) would be separate cache entries,
+# so the cache is keyed on a single positional argument
+@cache
+def _get_engine(readonly: bool) -> Engine:
+    db = database_path()
+    if readonly:
+        url = f"sqlite:///file:{quote(db.as_posix())}?mode=ro&uri=true"
+        pragmas = _READONLY_PRAGMAS
+    else:
+        url = f"sqlite:///{db}"
+        pragmas = _MAINTENANCE_PRAGMAS
+
+    engine = create_engine(
+        url,
+        echo=False,
+        connect_args={"check_same_thread": False},
+        future=True,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+@cache
+def _sessionmaker(readonly: bool) -> sessionmaker:
+    return sessionmaker(bind=_get_engine(readonly), future=True)
+
 
 @contextmanager
-def database():
-    with path("cchdo.params", "params.sqlite3") as f:
-        engine = create_engine(
-            f"sqlite:///{f}",
-            echo=False,
-            connect_args={"check_same_thread": False},
-            future=True,
-        )
-        Session = sessionmaker(bind=engine, future=True)
-        with Session() as session:
-            yield session
+def database(readonly: bool = False):
+    """Context manager yielding a session on the pooled params database engine
+
+    :param readonly: use the read only engine, see :func:`get_engine`
+    """
+    Session = _sessionmaker(bool(readonly))
+    with Session() as session:
+        yield session
 
 
 class ConfigDict(MutableMapping):
@@ -254,3 +325,243 @@ class Alias(Base):
             ["whp_names.whp_name", "whp_names.whp_unit"],
         ),
     )
+
+
+AliasKey = tuple[str, str | None]
+
+
+def compile_aliases(
+    aliases: Mapping[AliasKey, AliasKey], names: Container[AliasKey]
+) -> dict[AliasKey, AliasKey]:
+    """Flatten the alias table so every alias points directly at an existing parameter
+
+    This is done by gen_code so that loading the generated table at import needs no validation.
+
+    >>> compile_aliases({("A", None): ("B", None), ("B", None): ("C", "X")}, {("C", "X")})
+    {('A', None): ('C', 'X'), ('B', None): ('C', 'X')}
+
+    :param aliases: mapping of (name, unit) aliases to the (name, unit) they stand for, which may be another alias
+    :param names: the (name, unit) keys of all the parameters
+    :raises ValueError: if an alias shadows a parameter, the aliases form a cycle,
+                        or an alias does not end at a parameter
+    """
+    compiled = {}
+    for alias, target in aliases.items():
+        if alias in names:
+            raise ValueError(f"Alias {alias} shadows an existing parameter")
+        chain = [alias]
+        while target in aliases:
+            if target in chain:
+                cycle = " -> ".join(str(key) for key in [*chain, target])
+                raise ValueError(f"Alias cycle {cycle}")
+            chain.append(target)
+            target = aliases[target]
+        if target not in names:
+            raise ValueError(
+                f"Alias {alias} resolves to {target} which is not a parameter"
+            )
+        compiled[alias] = target
+    return compiled
+
+
+_CF_NAME_COLUMNS = ("canonical_units", "grib", "amip", "description")
+
+
+def iter_cf_xml(cf_xml) -> Iterator[tuple[str, str | dict[str, str | None] | None]]:
+    """Stream the contents of a CF standard name table XML file
+
+    Yields ``(tag, value)`` tuples for each top level element as it is parsed.
+    For ``entry`` and ``alias`` elements the value is a dict of the row for the
+    :class:`CFName` or :class:`CFAlias` table, for all others it is the element text.
+    Elements are discarded once yielded so the whole document is never held in memory.
+    """
+    depth = 0
+    root = None
+    for action, element in iterparse(cf_xml, events=("start", "end")):
+        if action == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth != 1:
+            continue
+
+        if element.tag == "entry":
+            name_info = {info.tag: info.text for info in element}
+            yield (
+                "entry",
+                {
+                    "standard_name": element.attrib["id"],
+                    **{col: name_info.get(col) for col in _CF_NAME_COLUMNS},
+                },
+            )
+        elif element.tag == "alias":
+            yield (
+                "alias",
+                {
+                    "alias": element.attrib["id"],
+                    "standard_name": element.findtext("entry_id"),
+                },
+            )
+        else:
+            yield element.tag, element.text
+
+        root.clear()
+
+
+def stage_cf_xml(session, cf_xml, batch_size: int = 1000) -> dict[str, str | None]:
+    """Load a CF standard name table XML file into temporary staging tables
+
+    The ``cf_names_staging`` and ``cf_aliases_staging`` tables only exist for the connection of `session`.
+
+    :returns: the text of the non entry/alias elements, e.g. ``version_number`` and ``last_modified``
+    """
+    session.execute(text("DROP TABLE IF EXISTS temp.cf_names_staging"))
+    session.execute(text("DROP TABLE IF EXISTS temp.cf_aliases_staging"))
+    session.execute(
+        text(
+            "CREATE TEMP TABLE cf_names_staging ("
+            "standard_name TEXT PRIMARY KEY, canonical_units TEXT, grib TEXT, amip TEXT, description TEXT)"
+        )
+    )
+    session.execute(
+        text(
+            "CREATE TEMP TABLE cf_aliases_staging ("
+            "alias TEXT NOT NULL, standard_name TEXT NOT NULL, PRIMARY KEY (alias, standard_name))"
+        )
+    )
+    insert_name = text(
+        "INSERT INTO cf_names_staging VALUES "
+        "(:standard_name, :canonical_units, :grib, :amip, :description)"
+    )
+    insert_alias = text(
+        "INSERT INTO cf_aliases_staging VALUES (:alias, :standard_name)"
+    )
+
+    info: dict[str, str | None] = {}
+    batches: dict[str, list] = {"entry": [], "alias": []}
+    statements = {"entry": insert_name, "alias": insert_alias}
+    for tag, value in iter_cf_xml(cf_xml):
+        if tag not in batches:
+            info[tag] = value  # type: ignore[assignment]
+            continue
+        batch = batches[tag]
+        batch.append(value)
+        if len(batch) >= batch_size:
+            session.execute(statements[tag], batch)
+            batch.clear()
+
+    for tag, batch in batches.items():
+        if batch:
+            session.execute(statements[tag], batch)
+
+    return info
+
+
+def diff_cf_staging(session) -> dict:
+    """Compare the staged CF standard name table with the current one
+
+    :returns: a JSON serializable report with ``cf_names`` and ``cf_aliases`` sections.
+              ``cf_names`` has ``added`` and ``removed`` lists of names and ``changed`` names as
+              ``{name: {column: [old, new]}}``.
+              ``cf_aliases`` has ``added`` and ``removed`` lists of ``[alias, standard_name]`` pairs.
+    """
+    added_names = session.execute(
+        text(
+            "SELECT standard_name FROM cf_names_staging "
+            "WHERE standard_name NOT IN (SELECT standard_name FROM cf_names) "
+            "ORDER BY standard_name"
+        )
+    ).scalars()
+    removed_names = session.execute(
+        text(
+            "SELECT standard_name FROM cf_names "
+            "WHERE standard_name NOT IN (SELECT standard_name FROM cf_names_staging) "
+            "ORDER BY standard_name"
+        )
+    ).scalars()
+
+    old_cols = ", ".join(f"c.{col}" for col in _CF_NAME_COLUMNS)
+    new_cols = ", ".join(f"s.{col}" for col in _CF_NAME_COLUMNS)
+    differs = " OR ".join(f"c.{col} IS NOT s.{col}" for col in _CF_NAME_COLUMNS)
+    changed_names = {}
+    for name, *values in session.execute(
+        text(
+            f"SELECT c.standard_name, {old_cols}, {new_cols} FROM cf_names AS c "
+            f"JOIN cf_names_staging AS s ON c.standard_name = s.standard_name "
+            f"WHERE {differs} ORDER BY c.standard_name"
+        )
+    ):
+        old, new = values[: len(_CF_NAME_COLUMNS)], values[len(_CF_NAME_COLUMNS) :]
+        changed_names[name] = {
+            col: [o, n] for col, o, n in zip(_CF_NAME_COLUMNS, old, new) if o != n
+        }
+
+    # an alias may point to more than one name, so alias rows are compared as pairs
+    added_aliases = session.execute(
+        text(
+            "SELECT alias, standard_name FROM cf_aliases_staging "
+            "EXCEPT SELECT alias, standard_name FROM cf_aliases ORDER BY 1, 2"
+        )
+    )
+    removed_aliases = session.execute(
+        text(
+            "SELECT alias, standard_name FROM cf_aliases "
+            "EXCEPT SELECT alias, standard_name FROM cf_aliases_staging ORDER BY 1, 2"
+        )
+    )
+
+    return {
+        "cf_names": {
+            "added": list(added_names),
+            "removed": list(removed_names),
+            "changed": changed_names,
+        },
+        "cf_aliases": {
+            "added": [list(row) for row in added_aliases],
+            "removed": [list(row) for row in removed_aliases],
+        },
+    }
+
+
+def apply_cf_staging(session) -> None:
+    """Replace the CF standard name table with the staged one using set based statements
+
+    The caller is responsible for committing the session.
+    """
+    cols = ", ".join(_CF_NAME_COLUMNS)
+    updates = ", ".join(f"{col} = excluded.{col}" for col in _CF_NAME_COLUMNS)
+    differs = " OR ".join(
+        f"cf_names.{col} IS NOT excluded.{col}" for col in _CF_NAME_COLUMNS
+    )
+    # the WHERE true is needed to disambiguate the upsert ON CONFLICT from a join
+    session.execute(
+        text(
+            f"INSERT INTO cf_names (standard_name, {cols}) "
+            f"SELECT standard_name, {cols} FROM cf_names_staging WHERE true "
+            f"ON CONFLICT (standard_name) DO UPDATE SET {updates} WHERE {differs}"
+        )
+    )
+
+    session.execute(
+        text(
+            "INSERT INTO cf_aliases (alias, standard_name) "
+            "SELECT alias, standard_name FROM cf_aliases_staging "
+            "EXCEPT SELECT alias, standard_name FROM cf_aliases ORDER BY 1, 2"
+        )
+    )
+    session.execute(
+        text(
+            "DELETE FROM cf_aliases WHERE NOT EXISTS (SELECT 1 FROM cf_aliases_staging AS s "
+            "WHERE s.alias = cf_aliases.alias AND s.standard_name = cf_aliases.standard_name)"
+        )
+    )
+
+    # names last, aliases may have referenced them
+    session.execute(
+        text(
+            "DELETE FROM cf_names WHERE standard_name NOT IN (SELECT standard_name FROM cf_names_staging)"
+        )
+    )
@@ -0,0 +1,194 @@
+"""Text dumps of the params sqlite database and a fast check that a dump matches its database
+
+The database is tracked in git as both the sqlite file and its ``iterdump`` text so changes can be reviewed.
+Alongside the dump an index is written with the sha256 of both files and of each table's statements,
+this lets a consistency check compare digests rather than the full text and,
+when they differ, narrow the problem down to the tables and rows involved.
+"""
+
+import json
+import re
+import sqlite3
+from collections.abc import Iterable, Iterator
+from hashlib import sha256
+from importlib.resources import files
+from pathlib import Path
+from typing import NamedTuple
+
+#: statements that are not part of a table (e.g. BEGIN/COMMIT, indexes) are grouped under this name
+SCHEMA_CHUNK = ""
+
+_TABLE_RE = re.compile(
+    r'^(?:CREATE TABLE (?:IF NOT EXISTS )?"?|INSERT INTO ")((?:[^"\s(]|"")+)'
+)
+# statements never start in the middle of a line, and a statement ends with ";\n",
+# string literals may contain both newlines and semicolons so look for a known statement start too
+_STATEMENT_SPLIT_RE = re.compile(
+    rb"(?<=;\n)(?=INSERT INTO |CREATE |COMMIT;|BEGIN |DELETE FROM |PRAGMA |ANALYZE )"
+)
+
+
+class DumpMismatch(NamedTuple):
+    """A table whose statements differ between a database and its text dump"""
+
+    table: str
+    #: statements produced by the database which are not in the dump
+    only_in_database: tuple[str, ...]
+    #: statements in the dump which the database does not produce
+    only_in_dump: tuple[str, ...]
+
+
+def statement_table(statement: str) -> str:
+    """The name of the table a dump statement belongs to, or :data:`SCHEMA_CHUNK`
+
+    >>> statement_table('INSERT INTO "cf_names" VALUES(1);')
+    'cf_names'
+    >>> statement_table("CREATE TABLE cf_names (")
+    'cf_names'
+    >>> statement_table("COMMIT;")
+    ''
+    """
+    if (match := _TABLE_RE.match(statement)) is None:
+        return SCHEMA_CHUNK
+    return match.group(1).replace('""', '"')
+
+
+def iter_database_statements(db: Path | str) -> Iterator[str]:
+    """Yields the statements of a database dump, each terminated with a newline"""
+    with sqlite3.connect(db) as conn:
+        for line in conn.iterdump():
+            yield f"{line}\n"
+
+
+def split_dump_statements(dump: bytes) -> list[str]:
+    """Split the text of a dump back into the statements :func:`iter_database_statements` produced"""
+    return [statement.decode("utf8") for statement in _STATEMENT_SPLIT_RE.split(dump)]
+
+
+def _group_tables(statements: Iterable[str]) -> dict[str, list[str]]:
+    tables: dict[str, list[str]] = {}
+    for statement in statements:
+        tables.setdefault(statement_table(statement), []).append(statement)
+    return tables
+
+
+def _table_digests(tables: dict[str, list[str]]) -> dict[str, dict]:
+    digests = {}
+    for table, statements in tables.items():
+        digest = sha256()
+        for statement in statements:
+            digest.update(statement.encode("utf8"))
+        digests[table] = {"sha256": digest.hexdigest(), "statements": len(statements)}
+    return digests
+
+
+def _file_digest(path: Path) -> str:
+    with path.open("rb") as f:
+        return sha256(f.read()).hexdigest()
+
+
+def index_path(dump: Path) -> Path:
+    """The path of the digest index which accompanies the dump file `dump`"""
+    return dump.with_name(f"{dump.name}.index.json")
+
+
+def write_dump(db: Path, dump: Path) -> dict:
+    """Dump the database `db` as SQL text to `dump` and write its digest index
+
+    Statements are streamed to the file while the per table and whole file digests are updated.
+
+    :returns: the index
+    """
+    file_digest = sha256()
+    table_digests: dict[str, tuple] = {}
+    with dump.open("w", encoding="utf8", newline="") as f:
+        for statement in iter_database_statements(db):
+            f.write(statement)
+            encoded = statement.encode("utf8")
+            file_digest.update(encoded)
+            table = statement_table(statement)
+            digest, count = table_digests.get(table, (sha256(), 0))
+            digest.update(encoded)
+            table_digests[table] = (digest, count + 1)
+
+    index = {
+        "database_sha256": _file_digest(db),
+        "dump_sha256": file_digest.hexdigest(),
+        "tables": {
+            table: {"sha256": digest.hexdigest(), "statements": count}
+            for table, (digest, count) in table_digests.items()
+        },
+    }
+    with index_path(dump).open("w", encoding="utf8") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+    return index
+
+
+def check_dump(db: Path, dump: Path) -> list[DumpMismatch]:
+    """Check that the text `dump` is what `db` would dump to
+
+    If both files still have the digests recorded in the index this only costs hashing the two files.
+    Otherwise the per table digests are compared and only the tables that differ are diffed.
+
+    :returns: a list of the tables that differ, empty if the dump matches
+    """
+    try:
+        index = json.loads(index_path(dump).read_text(encoding="utf8"))
+    except FileNotFoundError:
+        index = {"tables": None}
+
+    db_ok = index.get("database_sha256") == _file_digest(db)
+    dump_bytes = dump.read_bytes()
+    dump_ok = index.get("dump_sha256") == sha256(dump_bytes).hexdigest()
+    if db_ok and dump_ok:
+        return []
+
+    db_tables = None
+    if db_ok:
+        db_digests = index["tables"]
+    else:
+        db_tables = _group_tables(iter_database_statements(db))
+        db_digests = _table_digests(db_tables)
+
+    dump_tables = None
+    if dump_ok:
+        dump_digests = index["tables"]
+    else:
+        dump_tables = _group_tables(split_dump_statements(dump_bytes))
+        dump_digests = _table_digests(dump_tables)
+
+    differing = sorted(
+        table
+        for table in db_digests.keys() | dump_digests.keys()
+        if db_digests.get(table) != dump_digests.get(table)
+    )
+    if len(differing) == 0:
+        return []
+
+    if db_tables is None:
+        db_tables = _group_tables(iter_database_statements(db))
+    if dump_tables is None:
+        dump_tables = _group_tables(split_dump_statements(dump_bytes))
+
+    mismatches = []
+    for table in differing:
+        db_statements = db_tables.get(table, [])
+        dump_statements = dump_tables.get(table, [])
+        in_db = set(db_statements)
+        in_dump = set(dump_statements)
+        mismatches.append(
+            DumpMismatch(
+                table=table,
+                only_in_database=tuple(s for s in db_statements if s not in in_dump),
+                only_in_dump=tuple(s for s in dump_statements if s not in in_db),
+            )
+        )
+    return mismatches
+
+
+def package_files() -> tuple[Path, Path]:
+    """The paths of the packaged params database and its dump"""
+    db = Path(str(files("cchdo.params").joinpath("params.sqlite3")))
+    return db, db.with_suffix(".sqlite3.sql")
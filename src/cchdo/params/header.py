@@ -0,0 +1,277 @@
+"""Fingerprints of WHP Exchange header lines and a cache of their resolved column plans
+
+Most Exchange files in an archive share one of a small number of exact parameter and unit lines.
+A header is reduced to a canonical fingerprint so the lookup of every column
+only happens the first time a header is seen, after that resolving a header costs one hash.
+"""
+
+from collections.abc import Callable, Sequence
+from hashlib import sha256
+from typing import TYPE_CHECKING, Literal, NamedTuple
+
+from .core import WHPName
+
+if TYPE_CHECKING:
+    from . import _WHPNames
+
+HeaderLine = str | Sequence[str]
+ColumnRole = Literal["data", "flag", "error"]
+
+
+class HeaderColumn(NamedTuple):
+    """A single column of an Exchange header resolved to its parameter"""
+
+    #: the position of the column in the file
+    index: int
+    #: the name as written in the file, e.g. ``CTDTMP_ALT_1_FLAG_W``
+    name: str
+    #: the unit as written in the file, ``None`` if empty
+    unit: str | None
+    #: the resolved parameter, with ``flag_col``, ``error_col``, and ``alt_depth`` set from the name
+    param: WHPName
+    role: ColumnRole
+    #: for flag and error columns, the index of the data column they belong to if it is in the header
+    base_index: int | None = None
+
+
+class ColumnPlan(NamedTuple):
+    """How to parse and format a single column of an Exchange file"""
+
+    column: HeaderColumn
+    #: converts the string value of a cell to a python value
+    parse: Callable[[str], object]
+    #: formats a python value back to an Exchange string, see :meth:`WHPName.formatter`
+    format: Callable[[object], str]
+
+    @property
+    def index(self) -> int:
+        return self.column.index
+
+    @property
+    def param(self) -> WHPName:
+        return self.column.param
+
+
+class HeaderPlan(NamedTuple):
+    """The resolved parameters of an Exchange header, in column order"""
+
+    fingerprint: str
+    columns: tuple[ColumnPlan, ...]
+
+    @property
+    def params(self) -> tuple[WHPName, ...]:
+        return tuple(column.param for column in self.columns)
+
+
+def _split(line: HeaderLine) -> list[str]:
+    if isinstance(line, str):
+        line = line.rstrip("\r\n").split(",")
+    return [part.strip() for part in line]
+
+
+def canonical_header(
+    params: HeaderLine, units: HeaderLine
+) -> tuple[tuple[str, str | None], ...]:
+    """The canonical (name, unit) pairs of a header
+
+    Whitespace around each name and unit is removed, empty units become ``None``,
+    and trailing empty columns (e.g. from a trailing comma) are dropped.
+
+    >>> canonical_header("EXPOCODE, CTDPRS,", ",DBAR,")
+    (('EXPOCODE', None), ('CTDPRS', 'DBAR'))
+
+    :param params: the parameter line of the file, or the already split names
+    :param units: the unit line of the file, or the already split units
+    :raises ValueError: if there are a different number of names and units
+    """
+    names = _split(params)
+    unit_names = _split(units)
+    while len(names) > 0 and names[-1] == "":
+        names.pop()
+    while len(unit_names) > len(names) and unit_names[-1] == "":
+        unit_names.pop()
+    if len(names) != len(unit_names):
+        raise ValueError(
+            f"Header has {len(names)} parameters but {len(unit_names)} units"
+        )
+    return tuple(
+        (name, None if unit == "" else unit)
+        for name, unit in zip(names, unit_names, strict=True)
+    )
+
+
+def header_fingerprint(params: HeaderLine, units: HeaderLine) -> str:
+    """A sha256 hex digest identifying the canonical form of a header
+
+    Headers which differ only in whitespace or trailing commas have the same fingerprint.
+
+    >>> header_fingerprint("EXPOCODE,CTDPRS", ",DBAR") == header_fingerprint(
+    ...     "EXPOCODE, CTDPRS,", " , DBAR ,"
+    ... )
+    True
+    """
+    return _digest(canonical_header(params, units))
+
+
+def _digest(header: tuple[tuple[str, str | None], ...]) -> str:
+    digest = sha256()
+    for name, unit in header:
+        digest.update(f"{name}\t{'' if unit is None else unit}\n".encode())
+    return digest.hexdigest()
+
+
+def _parse_flag(value: str) -> int:
+    return int(float(value))
+
+
+def _parse_header(
+    whpnames: "_WHPNames",
+    header: tuple[tuple[str, str | None], ...],
+    strict: bool,
+    unknown: list[tuple[int, str, str | None, str]] | None = None,
+) -> tuple[HeaderColumn, ...]:
+    """Resolve a canonical header, see :func:`parse_header`
+
+    If `unknown` is a list, columns which are not known parameters (and their flag columns)
+    are appended to it as (index, name, unit, error) and left out of the result rather than raising a KeyError.
+    """
+    columns: list[HeaderColumn] = []
+    # name as written -> position in columns, for finding the data column of flags
+    data_columns: dict[str, int] = {}
+    # name as written -> unit, of the columns added to unknown
+    unknown_units: dict[str, str | None] = {}
+    seen: set[tuple[WHPName, ColumnRole]] = set()
+    lookups = whpnames._header_params
+
+    def lookup(index: int, name: str, unit: str | None) -> WHPName | None:
+        if (param := lookups.get((name, unit))) is None:
+            try:
+                param = lookups[(name, unit)] = whpnames[(name, unit)]
+            except KeyError as err:
+                if unknown is None:
+                    raise
+                unknown.append((index, name, unit, f"KeyError: {err}"))
+                unknown_units[name] = unit
+                return None
+        return param
+
+    for index, (name, unit) in enumerate(header):
+        base_index = None
+        if name.endswith("_FLAG_W"):
+            base_name = name.removesuffix("_FLAG_W")
+            if base_name in unknown_units:
+                if unit is None:
+                    unit = unknown_units[base_name]
+                unknown.append(  # type: ignore[union-attr]
+                    (index, name, unit, f"KeyError: flag of unknown column {base_name}")
+                )
+                continue
+            if (position := data_columns.get(base_name)) is None:
+                raise ValueError(
+                    f"Flag column {name} at {index} does not follow a {base_name} column"
+                )
+            base_index = columns[position].index
+            if unit is None:
+                # flag columns usually have no units of their own, they share those of their data column
+                unit = columns[position].unit
+            if (param := lookup(index, name, unit)) is None:
+                continue
+            role: ColumnRole = "flag"
+            if strict and columns[-1].param != param:
+                raise ValueError(
+                    f"Flag column {name} at {index} does not directly follow {base_name}"
+                )
+        else:
+            if (param := lookup(index, name, unit)) is None:
+                continue
+            role = "error" if param.error_col else "data"
+            data_columns[name] = len(columns)
+            if role == "error":
+                base_index = next(
+                    (
+                        column.index
+                        for column in columns
+                        if column.role == "data" and column.param == param
+                    ),
+                    None,
+                )
+
+        if (param, role) in seen:
+            raise ValueError(f"Duplicate {role} column for {param} at {index}")
+        seen.add((param, role))
+        columns.append(HeaderColumn(index, name, unit, param, role, base_index))
+    return tuple(columns)
+
+
+def parse_header(
+    params: HeaderLine,
+    units: HeaderLine,
+    whpnames: "_WHPNames | None" = None,
+    strict: bool = False,
+) -> tuple[HeaderColumn, ...]:
+    """Resolve the parameter and unit lines of an Exchange file to a table of :class:`HeaderColumn`
+
+    Flag columns (``_FLAG_W``) take the units of their data column when they have none,
+    alternate (``_ALT_n``) and error (e.g. ``C14ERR``) columns are recognized,
+    and aliases are resolved to their parameter.
+
+    >>> for column in parse_header("CTDPRS,DELC14,C14ERR,DELC14_FLAG_W", "DBAR,/MILLE,/MILLE,"):
+    ...     print(column.index, column.role, column.param, column.base_index)
+    0 data WHPName("CTDPRS [DBAR]") None
+    1 data WHPName("DELC14 [/MILLE]") None
+    2 error WHPName("C14ERR [/MILLE]", error=True) 1
+    3 flag WHPName("DELC14 [/MILLE]_FLAG_W", flag=True) 1
+
+    The result is not cached, use :func:`header_plan` when the same headers are seen repeatedly.
+
+    :param whpnames: the registry to resolve against, defaults to :data:`cchdo.params.WHPNames`
+    :param strict: require every flag column to directly follow its data column or that column's error column
+    :raises KeyError: if a column is not a known parameter
+    :raises ValueError: if a flag column comes before its data column, or a column is duplicated
+    """
+    if whpnames is None:
+        from . import WHPNames as whpnames
+
+    return _parse_header(whpnames, canonical_header(params, units), strict)
+
+
+def _column_plan(column: HeaderColumn) -> ColumnPlan:
+    if column.role == "flag":
+        return ColumnPlan(column, _parse_flag, column.param.formatter(flag=True))
+    return ColumnPlan(column, column.param.data_type, column.param.formatter())
+
+
+def header_plan(
+    params: HeaderLine,
+    units: HeaderLine,
+    whpnames: "_WHPNames | None" = None,
+    strict: bool = False,
+) -> HeaderPlan:
+    """Resolve every column of an Exchange header to a :class:`ColumnPlan`
+
+    This is :func:`parse_header` with each column's parse and format functions,
+    plans are cached by :func:`header_fingerprint` on the `whpnames` instance,
+    so only the first file with a given header does any parameter lookups.
+
+    >>> plan = header_plan("EXPOCODE,CTDPRS,CTDPRS_FLAG_W", ",DBAR,")
+    >>> plan.params
+    (WHPName("EXPOCODE"), WHPName("CTDPRS [DBAR]"), WHPName("CTDPRS [DBAR]_FLAG_W", flag=True))
+    >>> header_plan("EXPOCODE, CTDPRS, CTDPRS_FLAG_W", ", DBAR,") is plan
+    True
+
+    :param whpnames: the registry to resolve against, defaults to :data:`cchdo.params.WHPNames`
+    :param strict: see :func:`parse_header`
+    :raises KeyError: if a column is not a known parameter
+    :raises ValueError: if the header is invalid, see :func:`parse_header`
+    """
+    if whpnames is None:
+        from . import WHPNames as whpnames
+
+    header = canonical_header(params, units)
+    fingerprint = _digest(header)
+    cache = whpnames._header_plans
+    if (plan := cache.get((fingerprint, strict))) is None:
+        columns = _parse_header(whpnames, header, strict)
+        plan = HeaderPlan(fingerprint, tuple(_column_plan(c) for c in columns))
+        cache[(fingerprint, strict)] = plan
+    return plan
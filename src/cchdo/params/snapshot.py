@@ -0,0 +1,344 @@
+"""In memory snapshots of the parameter registry and diffs between them
+
+Archive files written under older releases of this package were checked against the registry of that release,
+so reprocessing them needs to know what changed since, e.g. a new ``numeric_precision`` or ``cf_name``.
+A :class:`RegistrySnapshot` holds one release's parameters keyed by ``(whp_name, whp_unit)``,
+it can be taken from a loaded :data:`cchdo.params.WHPNames`,
+read from an old ``legacy_json`` document, or saved to and loaded from a snapshot file.
+Any number of snapshots can be held at once and compared with :func:`diff_snapshots`.
+"""
+
+import gzip
+import json
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, fields
+from functools import cached_property
+from os import PathLike
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, NamedTuple
+
+from .core import WHPName
+
+if TYPE_CHECKING:
+    from . import _WHPNames
+
+ParamKey = tuple[str, str | None]
+#: (alias name, alias unit) -> (name, unit)
+AliasMap = dict[ParamKey, ParamKey]
+
+#: the format version of snapshot files
+SNAPSHOT_VERSION = 1
+
+_API_FIELDS = {"alt_depth", "whp_name_alias", "whp_unit_alias", "error_col", "flag_col"}
+#: the fields of a WHPName a snapshot records
+SNAPSHOT_FIELDS = tuple(
+    field.name for field in fields(WHPName) if field.name not in _API_FIELDS
+)
+_LEGACY_JSON_FIELDS = frozenset(
+    {
+        "whp_name",
+        "whp_unit",
+        "flag_w",
+        "cf_name",
+        "numeric_min",
+        "numeric_max",
+        "numeric_precision",
+        "field_width",
+        "description",
+        "note",
+        "warning",
+        "error_name",
+        "cf_unit",
+        "reference_scale",
+        "whp_number",
+        "scope",
+        "dtype",
+    }
+)
+
+
+def _key(record: Mapping) -> ParamKey:
+    return record["whp_name"], record["whp_unit"]
+
+
+class RegistrySnapshot:
+    """The parameters (and optionally aliases) of one version of the registry
+
+    Records are plain dicts of field name to value, keyed by ``(whp_name, whp_unit)``.
+    Snapshots read from a ``legacy_json`` document only know the fields that format has,
+    these are listed in :attr:`fields` and comparisons are limited to the fields both sides know.
+
+    >>> snapshot = RegistrySnapshot.from_whpnames(label="current")
+    >>> snapshot[("CTDPRS", "DBAR")]["cf_name"]
+    'sea_water_pressure'
+    >>> snapshot["CTDPRS [DBAR]"]["numeric_precision"]
+    1
+    """
+
+    def __init__(
+        self,
+        records: Iterable[Mapping],
+        fields: Iterable[str] = SNAPSHOT_FIELDS,
+        aliases: AliasMap | None = None,
+        label: str | None = None,
+    ):
+        self.label = label
+        self.fields = frozenset(fields)
+        self.aliases = aliases
+        self.records: dict[ParamKey, dict] = {}
+        for record in records:
+            key = _key(record)
+            if key in self.records:
+                raise ValueError(f"Duplicate parameter {key} in snapshot {label}")
+            self.records[key] = {name: record.get(name) for name in self.fields}
+
+    def __repr__(self) -> str:
+        return f"<RegistrySnapshot {self.label!r}: {len(self)} params>"
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            return self._normalize(key) in self.records  # type: ignore[arg-type]
+        except (KeyError, ValueError):
+            return False
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, key: str | ParamKey) -> dict:
+        return self.records[self._normalize(key)]
+
+    def _normalize(self, key: str | ParamKey) -> ParamKey:
+        from . import normalize_odv_name
+
+        if isinstance(key, str):
+            key = normalize_odv_name(key, return_parts=True)
+        if self.aliases is not None and key in self.aliases:
+            return self.aliases[key]
+        return key
+
+    @classmethod
+    def from_whpnames(
+        cls, whpnames: "_WHPNames | None" = None, label: str | None = None
+    ) -> "RegistrySnapshot":
+        """Snapshot a loaded registry, defaults to :data:`cchdo.params.WHPNames` labeled with the package version"""
+        if whpnames is None:
+            from . import WHPNames as whpnames
+        if label is None:
+            from . import __version__ as label
+
+        columns = whpnames.columns
+        names = [name for name in SNAPSHOT_FIELDS if name in columns]
+        records = (dict(zip(names, row)) for row in zip(*(columns[n] for n in names)))
+        aliases = {
+            key if isinstance(key, tuple) and len(key) == 2 else (key, None): target
+            for key, target in whpnames._aliases.items()
+        }
+        return cls(records, names, aliases, label)  # type: ignore[arg-type]
+
+    @classmethod
+    def from_legacy_json(
+        cls, document: Iterable[Mapping], label: str | None = None
+    ) -> "RegistrySnapshot":
+        """Snapshot a ``legacy_json`` document, e.g. ``json.load`` of a saved ``whp json`` output
+
+        Optional fields missing from a record are ``None``, numeric fields of string parameters are ``None``,
+        and a ``flag_w`` of ``None`` is ``no_flags`` as in the database.
+        Legacy documents have no aliases.
+        """
+
+        def records():
+            for record in document:
+                record = dict(record)
+                record["dtype"] = record.pop("data_type", None)
+                if record.get("flag_w") is None:
+                    record["flag_w"] = "no_flags"
+                record.setdefault("scope", "sample")
+                yield record
+
+        return cls(records(), _LEGACY_JSON_FIELDS, None, label)
+
+    @classmethod
+    def load(cls, path: str | PathLike) -> "RegistrySnapshot":
+        """Read a snapshot file written by :meth:`save`, or a ``legacy_json`` document
+
+        Files ending in ``.gz`` are gzip compressed.
+        """
+        path = Path(path)
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf8") as f:
+            data = json.load(f)
+
+        if isinstance(data, list):
+            return cls.from_legacy_json(data, label=path.name)
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {data.get('version')}")
+        names = data["fields"]
+        aliases = None
+        if data["aliases"] is not None:
+            aliases = {
+                (name, unit): (to_name, to_unit)
+                for name, unit, to_name, to_unit in data["aliases"]
+            }
+        return cls(
+            (dict(zip(names, row)) for row in data["params"]),
+            names,
+            aliases,
+            data["label"],
+        )
+
+    def dump(self, fp: IO[str]) -> None:
+        """Write the snapshot as JSON, parameters are stored as rows of :attr:`fields` values"""
+        names = sorted(self.fields)
+        aliases = None
+        if self.aliases is not None:
+            aliases = [[*alias, *target] for alias, target in self.aliases.items()]
+        json.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "label": self.label,
+                "fields": names,
+                "aliases": aliases,
+                "params": [
+                    [record[name] for name in names] for record in self.records.values()
+                ],
+            },
+            fp,
+            separators=(",", ":"),
+        )
+
+    def save(self, path: str | PathLike) -> None:
+        """Write the snapshot to `path`, gzip compressed if it ends in ``.gz``"""
+        path = Path(path)
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "wt", encoding="utf8") as f:
+            self.dump(f)  # type: ignore[arg-type]
+
+
+class FieldChange(NamedTuple):
+    """A field of a parameter whose value differs between two snapshots"""
+
+    key: ParamKey
+    field: str
+    old: object
+    new: object
+
+
+@dataclass(frozen=True)
+class RegistryDiff:
+    """The differences between two :class:`RegistrySnapshot`, see :func:`diff_snapshots`"""
+
+    old_label: str | None
+    new_label: str | None
+    #: parameters only in the new snapshot
+    added: tuple[ParamKey, ...]
+    #: parameters only in the old snapshot
+    removed: tuple[ParamKey, ...]
+    #: parameter -> field -> change, only parameters with at least one changed field are included
+    changed: dict[ParamKey, dict[str, FieldChange]]
+    #: aliases added or retargeted in the new snapshot, empty if either snapshot has no aliases
+    aliases_added: AliasMap
+    #: aliases which are no longer in the new snapshot
+    aliases_removed: AliasMap
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.added
+            or self.removed
+            or self.changed
+            or self.aliases_added
+            or self.aliases_removed
+        )
+
+    @cached_property
+    def _by_field(self) -> dict[str, tuple[FieldChange, ...]]:
+        by_field: dict[str, list[FieldChange]] = {}
+        for changes in self.changed.values():
+            for change in changes.values():
+                by_field.setdefault(change.field, []).append(change)
+        return {name: tuple(changes) for name, changes in by_field.items()}
+
+    def by_field(self, field: str) -> tuple[FieldChange, ...]:
+        """Every change to `field`, e.g. ``"numeric_precision"``"""
+        return self._by_field.get(field, ())
+
+    @property
+    def fields(self) -> frozenset[str]:
+        """The names of all the fields with at least one change"""
+        return frozenset(self._by_field)
+
+
+def diff_snapshots(
+    old: RegistrySnapshot,
+    new: RegistrySnapshot,
+    fields: Iterable[str] | None = None,
+) -> RegistryDiff:
+    """Compare two snapshots of the registry
+
+    Parameters are matched by ``(whp_name, whp_unit)``,
+    whole records are compared first so only parameters which changed are compared field by field.
+
+    >>> old = RegistrySnapshot.from_whpnames(label="old")
+    >>> record = dict(old["CTDPRS [DBAR]"], numeric_precision=3)
+    >>> new = RegistrySnapshot([*(r for k, r in old.records.items() if k != ("CTDPRS", "DBAR")), record], label="new")
+    >>> diff = diff_snapshots(old, new)
+    >>> diff.changed[("CTDPRS", "DBAR")]
+    {'numeric_precision': FieldChange(key=('CTDPRS', 'DBAR'), field='numeric_precision', old=1, new=3)}
+    >>> diff.added, diff.removed
+    ((), ())
+
+    :param fields: the fields to compare, defaults to those known to both snapshots
+    """
+    if fields is None:
+        compared = old.fields & new.fields
+    else:
+        compared = frozenset(fields)
+        if unknown := compared - (old.fields & new.fields):
+            raise ValueError(f"Fields not in both snapshots: {sorted(unknown)}")
+    names = sorted(compared)
+    whole_records = old.fields == new.fields == compared
+
+    old_keys = old.records.keys()
+    new_keys = new.records.keys()
+    added = tuple(key for key in new_keys if key not in old.records)
+    removed = tuple(key for key in old_keys if key not in new.records)
+
+    changed: dict[ParamKey, dict[str, FieldChange]] = {}
+    for key, old_record in old.records.items():
+        if (new_record := new.records.get(key)) is None:
+            continue
+        if whole_records and old_record == new_record:
+            continue
+        changes = {
+            name: FieldChange(key, name, old_record[name], new_record[name])
+            for name in names
+            if old_record[name] != new_record[name]
+        }
+        if changes:
+            changed[key] = changes
+
+    aliases_added: AliasMap = {}
+    aliases_removed: AliasMap = {}
+    if old.aliases is not None and new.aliases is not None:
+        aliases_added = {
+            alias: target
+            for alias, target in new.aliases.items()
+            if old.aliases.get(alias) != target
+        }
+        aliases_removed = {
+            alias: target
+            for alias, target in old.aliases.items()
+            if alias not in new.aliases
+        }
+
+    return RegistryDiff(
+        old.label,
+        new.label,
+        added,
+        removed,
+        changed,
+        aliases_added,
+        aliases_removed,
+    )
@@ -55,3 +55,53 @@ def test_add_alias_flag_depth(whpnames):
     assert whpnames["test"].whp_unit_alias is None
     assert whpnames["test"].alt_depth == 1
     assert whpnames["test"].flag_col is True
+
+
+def test_add_alias_chain(whpnames):
+    whpnames.add_alias(("test", None), ("CTDPRS", "DBAR"))
+    whpnames.add_alias(("test2", None), ("test", None))
+
+    assert whpnames._aliases[("test2", None)] == ("CTDPRS", "DBAR")
+    assert whpnames["test2"] == whpnames["CTDPRS [DBAR]"]
+    assert whpnames["test2"].whp_name_alias == "test2"
+
+
+def test_default_aliases_flat(whpnames):
+    for alias, target in whpnames._aliases.items():
+        assert alias not in whpnames._aliases.values()
+        assert dict.__contains__(whpnames, target)
+
+
+def test_compile_aliases():
+    from cchdo.params.db import compile_aliases
+
+    names = {("C", "X")}
+    assert compile_aliases(
+        {("A", None): ("B", None), ("B", None): ("C", "X")}, names
+    ) == {
+        ("A", None): ("C", "X"),
+        ("B", None): ("C", "X"),
+    }
+
+
+@pytest.mark.parametrize(
+    "aliases",
+    [
+        {("C", "X"): ("A", None)},
+        {("A", None): ("B", None), ("B", None): ("A", None)},
+        {("A", None): ("A", None)},
+        {("A", None): ("D", None)},
+    ],
+)
+def test_compile_aliases_invalid(aliases):
+    from cchdo.params.db import compile_aliases
+
+    with pytest.raises(ValueError):
+        compile_aliases(aliases, {("C", "X")})
+
+
+def test_alias_flag_tuple_key(whpnames):
+    flag = whpnames[("CTDPRS_FLAG_W", "DBARS")]
+    assert flag == whpnames["CTDPRS [DBAR]"]
+    assert flag.flag_col is True
+    assert flag.whp_unit_alias == "DBARS"
@@ -0,0 +1,247 @@
+import os
+import sqlite3
+import zipfile
+
+import pytest
+
+from cchdo.params.archive import (
+    ArchiveIndex,
+    read_file_headers,
+    survey,
+    walk_exchange_files,
+)
+
+BOTTLE = """BOTTLE,20240101CCHSIOABC
+# a comment
+EXPOCODE,STNNBR,CTDPRS,CTDPRS_FLAG_W,OXYGEN,OXYGEN_FLAG_W,NOTAPARAM
+,,DBARS,,UMOL/KG,,
+33RR20160208,1,5.0,2,200.1,2,1
+END_DATA
+"""
+
+CTD = """CTD,20240101CCHSIOABC
+NUMBER_HEADERS = 2
+EXPOCODE = 33RR20160208
+CTDPRS,CTDPRS_FLAG_W,CTDTMP,CTDTMP_FLAG_W
+DBAR,,ITS-90,
+1.0,2,20.0,2
+END_DATA
+"""
+
+
+@pytest.fixture
+def archive(tmp_path):
+    (tmp_path / "cruise").mkdir()
+    (tmp_path / "cruise" / "bottle_hy1.csv").write_text(BOTTLE)
+    with zipfile.ZipFile(tmp_path / "cruise" / "ctd.zip", "w") as zf:
+        zf.writestr("00001_ct1.csv", CTD)
+        zf.writestr("00002_ct1.csv", CTD)
+        zf.writestr("README.txt", "not exchange")
+    (tmp_path / "cruise" / "notes.txt").write_text("ignored")
+    (tmp_path / "broken_hy1.csv").write_text("BOTTLE,20240101\n# only comments\n")
+    return tmp_path
+
+
+def test_walk_exchange_files(archive):
+    assert [
+        path.removeprefix(str(archive)) for path in walk_exchange_files([archive])
+    ] == [
+        "/broken_hy1.csv",
+        "/cruise/bottle_hy1.csv",
+        "/cruise/ctd.zip",
+    ]
+
+
+def test_read_file_headers(archive):
+    result = read_file_headers(archive / "cruise" / "ctd.zip")
+    assert result.error is None
+    assert [member for member, _ in result.headers] == [
+        "00001_ct1.csv",
+        "00002_ct1.csv",
+    ]
+    assert result.headers[0][1][:2] == (("CTDPRS", "DBAR"), ("CTDPRS_FLAG_W", None))
+
+    broken = read_file_headers(archive / "broken_hy1.csv")
+    assert broken.headers == ()
+    assert broken.error is not None
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_survey(archive, whpnames, max_workers):
+    report = survey([archive], whpnames, max_workers=max_workers)
+    assert report["files"] == 3
+    assert report["headers"] == 3
+    assert report["distinct_headers"] == 2
+    assert [item["path"] for item in report["unreadable"]] == [
+        str(archive / "broken_hy1.csv")
+    ]
+
+    params = {(record["name"], record["unit"]): record for record in report["params"]}
+    assert params[("CTDPRS", "DBAR")]["count"] == 2
+    assert params[("CTDPRS_FLAG_W", "DBAR")]["key"] == "CTDPRS [DBAR]_FLAG_W"
+    assert params[("CTDPRS", "DBARS")]["alias"] == ["CTDPRS", "DBARS"]
+    assert params[("CTDPRS_FLAG_W", "DBARS")]["key"] == "CTDPRS [DBAR]_FLAG_W"
+    assert params[("NOTAPARAM", None)]["error"].startswith("KeyError")
+    assert report["unresolved"] == 1
+
+
+def test_survey_invalid_headers(tmp_path, whpnames):
+    # the flag column comes before its data column
+    (tmp_path / "flag_first_hy1.csv").write_text(
+        "BOTTLE,20240101CCHSIOABC\nCTDPRS_FLAG_W,CTDPRS\n,DBAR\n"
+    )
+    (tmp_path / "duplicate_hy1.csv").write_text(
+        "BOTTLE,20240101CCHSIOABC\nCTDPRS,CTDPRS\nDBAR,DBARS\n"
+    )
+    (tmp_path / "unknown_hy1.csv").write_text(
+        "BOTTLE,20240101CCHSIOABC\nNOTAPARAM,NOTAPARAM_FLAG_W,CTDPRS,CTDPRS_FLAG_W\nUNIT,,DBAR,\n"
+    )
+
+    report = survey([tmp_path], whpnames, max_workers=1)
+    invalid = {tuple(item["params"]): item for item in report["invalid_headers"]}
+    assert invalid.keys() == {("CTDPRS_FLAG_W", "CTDPRS"), ("CTDPRS", "CTDPRS")}
+    assert all(item["error"].startswith("ValueError") for item in invalid.values())
+
+    params = {(record["name"], record["unit"]): record for record in report["params"]}
+    # only the columns of valid headers are counted
+    assert params.keys() == {
+        ("NOTAPARAM", "UNIT"),
+        ("NOTAPARAM_FLAG_W", "UNIT"),
+        ("CTDPRS", "DBAR"),
+        ("CTDPRS_FLAG_W", "DBAR"),
+    }
+    assert params[("CTDPRS_FLAG_W", "DBAR")]["key"] == "CTDPRS [DBAR]_FLAG_W"
+    assert params[("NOTAPARAM_FLAG_W", "UNIT")]["error"].startswith("KeyError")
+    assert report["unresolved"] == 2
+
+
+def test_archive_index(archive, whpnames, tmp_path_factory):
+    db = tmp_path_factory.mktemp("index") / "index.sqlite3"
+    bottle = archive / "cruise" / "bottle_hy1.csv"
+
+    with ArchiveIndex(db, whpnames) as index:
+        assert index.update([archive], max_workers=2) == {
+            "unchanged": 0,
+            "touched": 0,
+            "updated": 3,
+            "removed": 0,
+        }
+        hits = index.query(param="CTDPRS", unit="DBAR")
+        assert [(hit.path, hit.member, hit.position) for hit in hits] == [
+            (str(bottle), None, 2),
+            (str(bottle), None, 3),
+            (str(archive / "cruise" / "ctd.zip"), "00001_ct1.csv", 0),
+            (str(archive / "cruise" / "ctd.zip"), "00001_ct1.csv", 1),
+            (str(archive / "cruise" / "ctd.zip"), "00002_ct1.csv", 0),
+            (str(archive / "cruise" / "ctd.zip"), "00002_ct1.csv", 1),
+        ]
+        assert [hit.key for hit in index.query(param="CTDPRS", alias=True)] == [
+            "CTDPRS [DBAR]",
+            "CTDPRS [DBAR]_FLAG_W",
+        ]
+        # the files which wrote the CTDPRS [DBARS] alias, and its flag column
+        hits = index.query(name="CTDPRS", written_unit="DBARS")
+        assert [(hit.path, hit.position, hit.key) for hit in hits] == [
+            (str(bottle), 2, "CTDPRS [DBAR]")
+        ]
+        (flag,) = index.query(name="CTDPRS_FLAG_W", alias=True)
+        assert (flag.unit, flag.written_unit) == ("DBARS", None)
+        assert len(index.query(name="CTDPRS_FLAG_W", written_unit="")) == 3
+        assert {hit.key for hit in index.query(unit="UMOL/KG")} == {
+            "OXYGEN [UMOL/KG]",
+            "OXYGEN [UMOL/KG]_FLAG_W",
+        }
+        assert index.unresolved()[0][:2] == ("NOTAPARAM", None)
+
+    # reopening and rerunning reads nothing
+    with ArchiveIndex(db, whpnames) as index:
+        assert index.update([archive], max_workers=1)["unchanged"] == 3
+
+        stat = bottle.stat()
+        os.utime(bottle, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert index.update([archive], max_workers=1)["touched"] == 1
+
+        bottle.write_text(
+            BOTTLE.replace("CTDPRS,CTDPRS_FLAG_W", "CTDRAW,CTDRAW_FLAG_W")
+        )
+        assert index.update([archive], max_workers=1)["updated"] == 1
+        assert {hit.path for hit in index.query(param="CTDPRS")} == {
+            str(archive / "cruise" / "ctd.zip")
+        }
+
+        (archive / "cruise" / "ctd.zip").unlink()
+        assert index.update([archive], max_workers=1)["removed"] == 1
+        assert index.query(param="CTDPRS") == []
+
+        # a registry change re-resolves the stored columns
+        whpnames.add_alias(("NOTAPARAM", None), ("CTDSAL", "PSS-78"))
+        assert index.update([archive], max_workers=1)["unchanged"] == 2
+        assert [hit.name for hit in index.query(param="CTDSAL", alias=True)] == [
+            "NOTAPARAM"
+        ]
+        assert "NOTAPARAM" not in {name for name, *_ in index.unresolved()}
+
+
+def test_archive_index_rebuilds_old_versions(archive, whpnames, tmp_path_factory):
+    db = tmp_path_factory.mktemp("index") / "index.sqlite3"
+    with ArchiveIndex(db, whpnames) as index:
+        index.update([archive], max_workers=1)
+        with index.conn:
+            index.conn.execute("UPDATE meta SET value = '1' WHERE key = 'version'")
+
+    with ArchiveIndex(db, whpnames) as index:
+        assert index.query() == []
+        assert index.update([archive], max_workers=1)["updated"] == 3
+        assert len(index.query(name="CTDPRS", written_unit="DBARS")) == 1
+
+
+def test_archive_index_rebuilds_unversioned(archive, whpnames, tmp_path_factory):
+    db = tmp_path_factory.mktemp("index") / "index.sqlite3"
+    # the tables of an index written before the schema had a version
+    with sqlite3.connect(db) as conn:
+        conn.executescript(
+            """
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            INSERT INTO meta VALUES ('registry', 'old');
+            CREATE TABLE files (
+                path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL, error TEXT
+            );
+            CREATE TABLE columns (
+                path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+                member TEXT NOT NULL, position INTEGER NOT NULL,
+                name TEXT NOT NULL, unit TEXT NOT NULL,
+                PRIMARY KEY (path, member, position)
+            );
+            CREATE INDEX columns_name_unit ON columns (name, unit);
+            INSERT INTO files VALUES ('gone.csv', 0, 0, '', NULL);
+            """
+        )
+    conn.close()
+
+    with ArchiveIndex(db, whpnames) as index:
+        assert index.conn.execute("SELECT count(*) FROM files").fetchone() == (0,)
+        assert index.update([archive], max_workers=1)["updated"] == 3
+        assert len(index.query(name="CTDPRS", written_unit="DBARS")) == 1
+
+    # a new index is not dropped when it is opened again
+    with ArchiveIndex(db, whpnames) as index:
+        assert index.update([archive], max_workers=1)["unchanged"] == 3
+
+
+def test_index_query_command(archive, tmp_path_factory):
+    CliRunner = pytest.importorskip("click.testing").CliRunner
+    from cchdo.params.__main__ import cli
+
+    db = str(tmp_path_factory.mktemp("index") / "index.sqlite3")
+    runner = CliRunner()
+    result = runner.invoke(cli, ["index", "update", db, str(archive), "-j", "1"])
+    assert result.exit_code == 0, result.output
+
+    result = runner.invoke(
+        cli, ["index", "query", db, "--name", "CTDPRS", "--written-unit", "DBARS"]
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == [
+        f"{archive / 'cruise' / 'bottle_hy1.csv'}\t\t2\tCTDPRS [DBAR]"
+    ]
@@ -0,0 +1,207 @@
+import dataclasses
+from datetime import date, time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from cchdo.params.arrays import (  # noqa: E402
+    ColumnPrecision,
+    combine_datetimes,
+    decode_dates,
+    decode_times,
+    encode_dates,
+    encode_times,
+    field_widths,
+    precision_overrides,
+    required_width,
+    scan_precision,
+)
+from cchdo.params.header import parse_header  # noqa: E402
+
+
+@pytest.mark.parametrize("kind", [str, bytes, object])
+def test_decode_dates(kind):
+    values = ["20200229", "20210229", "20201301", "20200100", "2020010", "2020o101", ""]
+    if kind is bytes:
+        arr = np.array([value.encode() for value in values])
+    elif kind is object:
+        arr = np.array([value.encode() for value in values], dtype=object)
+    else:
+        arr = np.array(values)
+    dates = decode_dates(arr)
+    assert dates.dtype == np.dtype("M8[D]")
+    assert dates.mask.tolist() == [False, True, True, True, True, True, True]
+    assert dates[0] == np.datetime64("2020-02-29")
+
+
+def test_decode_dates_shape():
+    dates = decode_dates(np.array([["20200101", "bad"], ["19700101", "99991231"]]))
+    assert dates.shape == (2, 2)
+    assert dates.mask.tolist() == [[False, True], [False, False]]
+
+
+def test_decode_dates_rejects_numbers():
+    with pytest.raises(TypeError):
+        decode_dates(np.array([20200101]))
+
+
+def test_decode_times():
+    times = decode_times(np.array([b"0000", b"0959", b"2360", b"-100", b" 1200"]))
+    assert times.mask.tolist() == [False, False, True, True, False]
+    assert times.compressed().astype(int).tolist() == [0, 599, 720]
+
+
+@pytest.mark.parametrize("whp_name,date_or_time", [("DATE", "date"), ("TIME", "time")])
+def test_roundtrip_strfex(whpnames, whp_name, date_or_time):
+    """encoding matches strfex, and decoding inverts it"""
+    param = whpnames[whp_name]
+    if date_or_time == "date":
+        values = [date(1970, 1, 1), date(2000, 2, 29), date(2024, 12, 31)]
+        arr = np.array(values, dtype="M8[D]")
+        encoded = encode_dates(arr)
+        decoded = decode_dates(encoded)
+    else:
+        values = [time(0, 0), time(9, 5), time(23, 59)]
+        arr = np.array([v.hour * 60 + v.minute for v in values], dtype="m8[m]")
+        encoded = encode_times(arr)
+        decoded = decode_times(encoded)
+
+    assert encoded.tolist() == [param.strfex(value) for value in values]
+    assert (decoded == arr).all()
+
+
+def test_combine_and_encode():
+    timestamps = combine_datetimes(
+        decode_dates(["20200101", "20200102", "nope"]),
+        decode_times(["1230", "", "0000"]),
+    )
+    assert timestamps.mask.tolist() == [False, True, True]
+    assert timestamps[0] == np.datetime64("2020-01-01T12:30")
+    assert encode_dates(timestamps).tolist() == ["20200101", "-999", "-999"]
+    assert encode_times(timestamps, fill="").tolist() == ["1230", "", ""]
+
+
+@pytest.mark.parametrize("kind", [str, bytes])
+def test_scan_precision(kind):
+    values = ["1.250", "+2.5", "-999", "3", "", "1e-3", "1.2.3", ".", "²", "-0.5"]
+    arr = np.array(
+        [
+            kind(value, "ascii") if kind is bytes else value
+            for value in values
+            if kind is str or value.isascii()
+        ]
+    )
+    result = scan_precision(arr)
+    assert result.max_decimals == 3
+    assert result.counts == {0: 1, 1: 2, 3: 1}
+    assert result.fill == 1
+    assert result.invalid == (5 if kind is str else 4)
+
+
+def test_scan_precision_empty():
+    assert scan_precision(np.array(["-999", ""])) == ColumnPrecision(None, {}, 1, 1)
+
+
+@pytest.mark.parametrize("value", ["--5", "+-1", "-+1.5", "++1", "-", "+.", "1-"])
+def test_scan_precision_signs(value):
+    result = scan_precision(np.array(["1.5", value]))
+    assert result.invalid == 1
+    assert result.counts == {1: 1}
+
+
+def test_precision_overrides(whpnames):
+    header = parse_header(
+        "EXPOCODE,CTDPRS,CTDTMP,CTDTMP_FLAG_W,CTDSAL,CTDSAL_FLAG_W",
+        ",DBAR,ITS-90,,PSS-78,",
+        whpnames,
+    )
+    values = [
+        np.array(["33RR20160208", "33RR20160208"]),
+        np.array(["1.0", "2.0"]),
+        np.array(["1.12345", "-999"]),
+        # the flag values must not replace those of their data column
+        np.array(["2", "9"]),
+        np.array(["-999", "-999"]),
+        np.array(["2.0", "9.0"]),
+    ]
+    columns = [(column.param, values[column.index]) for column in header]
+    assert precision_overrides(columns) == {2: 5}
+    assert precision_overrides(columns, changed_only=False) == {1: 1, 2: 5}
+
+    overrides = precision_overrides(columns)
+    ctdtmp = header[2].param
+    formatter = ctdtmp.formatter(numeric_precision_override=overrides.get(2))
+    assert formatter(1.12345).strip() == "1.12345"
+
+
+def test_precision_overrides_error_column(whpnames):
+    header = parse_header("DELC14,C14ERR", "/MILLE,/MILLE", whpnames)
+    columns = [
+        (header[0].param, np.array(["-12.1"])),
+        (header[1].param, np.array(["1.123"])),
+    ]
+    assert header[0].param == header[1].param
+    assert precision_overrides(columns, changed_only=False) == {0: 1, 1: 3}
+
+
+@pytest.mark.parametrize(
+    "key", ["CTDPRS [DBAR]", "CTDTMP [ITS-90]", "CASTNO", "STNNBR", "BTLNBR"]
+)
+@pytest.mark.parametrize("override", [None, 0, 6])
+def test_required_width_matches_strfex(whpnames, key, override):
+    param = whpnames[key]
+    rng = np.random.default_rng(0)
+    if param.dtype == "string":
+        values = np.array(["", "a", "x" * 20, "12345"])
+    else:
+        values = np.concatenate(
+            [
+                rng.normal(scale=1e6, size=50),
+                [np.nan, -0.0, -0.04, 9.96, -999.0, 1e11, -1e9],
+            ]
+        )
+    expected = max(
+        len(param.strfex(value, numeric_precision_override=override))
+        for value in values
+    )
+    assert required_width(param, values, override) == expected
+
+    formatter = param.formatter(
+        numeric_precision_override=override,
+        field_width_override=required_width(param, values, override),
+    )
+    assert {len(formatter(value)) for value in values} == {expected}
+
+
+def test_field_widths(whpnames):
+    header = parse_header(
+        "STNNBR,CTDPRS,CTDTMP,CTDTMP_FLAG_W", ",DBAR,ITS-90,", whpnames
+    )
+    values = [
+        np.array(["1", "2"]),
+        np.array([1.0, 2.0]),
+        np.array([1.0, -123456.0]),
+        # wider than the data, but flags are not padded
+        np.array([2.0, 123456789012.0]),
+    ]
+    columns = [(column.param, values[column.index]) for column in header]
+    assert field_widths(columns) == {2: 12}
+    assert field_widths(columns, {2: 6}) == {2: 14}
+    assert field_widths(columns, changed_only=False) == {
+        0: header[0].param.field_width,
+        1: header[1].param.field_width,
+        2: 12,
+    }
+
+
+def test_required_width_short_strings(whpnames):
+    param = whpnames["STNNBR"]
+    short = dataclasses.replace(param, field_width=2)
+    assert required_width(short, np.array(["a", "bc"])) == 2
+    assert required_width(short, np.array(["a", " "])) == 4
+    assert required_width(short, np.array(["abcde"])) == 5
+    assert field_widths([(short, np.array(["a", "bc"]))]) == {}
+    for values in (["a", "bc"], ["a", ""]):
+        width = required_width(short, np.array(values))
+        assert width == max(len(short.strfex(value)) for value in values)
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+# the command line interface needs click, which is not part of the selftest extra
+CliRunner = pytest.importorskip("click.testing").CliRunner
+
+from cchdo.params.__main__ import cli  # noqa: E402
+
+
+def resolve(stdin, *args):
+    result = CliRunner().invoke(cli, ["resolve", *args], input=stdin)
+    assert result.exit_code == 0, result.output
+    return [json.loads(line) for line in result.output.splitlines()]
+
+
+def test_resolve_lines():
+    records = resolve("CTDPRS [DBARS]\n\nNOT_A_PARAM\nCTDPRS [DBARS]\n")
+    assert [r["key"] for r in records if r["error"] is None] == [
+        "CTDPRS [DBAR]",
+        "CTDPRS [DBAR]",
+    ]
+    assert records[0]["alias"] == ["CTDPRS", "DBARS"]
+    assert records[1]["input"] == "NOT_A_PARAM"
+    assert records[1]["error"].startswith("KeyError")
+
+
+def test_resolve_csv_header():
+    header = (
+        "# a comment\n"
+        "EXPOCODE,CTDPRS,CTDTMP,CTDTMP_FLAG_W,\n"
+        ",DBAR,ITS-90,,\n"
+        "\n"
+        "CTDPRS,CTDSAL\n"
+        "DBARS\n"
+    )
+    records = resolve(header, "-f", "csv")
+    assert [r["input"] for r in records[:4]] == [
+        ["EXPOCODE", None],
+        ["CTDPRS", "DBAR"],
+        ["CTDTMP", "ITS-90"],
+        ["CTDTMP_FLAG_W", "ITS-90"],
+    ]
+    assert [r["key"] for r in records[:4]] == [
+        "EXPOCODE",
+        "CTDPRS [DBAR]",
+        "CTDTMP [ITS-90]",
+        "CTDTMP [ITS-90]_FLAG_W",
+    ]
+    assert all(r["error"] is None for r in records[:4])
+    # the second header has more parameters than units
+    assert records[4]["input"] == ["CTDPRS", "CTDSAL"]
+    assert records[4]["error"].startswith("ValueError")
+    assert len(records) == 5
+
+
+def test_resolve_csv_missing_units():
+    (record,) = resolve("CTDPRS,CTDTMP\n", "-f", "csv")
+    assert record["error"] == "ValueError: parameter line has no units line"
+
+
+@pytest.mark.parametrize(
+    "line,error",
+    [
+        ("{not json", "JSONDecodeError"),
+        ('{"name": "CTDPRS"}', "ValueError"),
+        ('[["CTDPRS"], "DBAR"]', "ValueError"),
+        ('["CTDPRS", "DBAR", "extra"]', "ValueError"),
+        ("42", "ValueError"),
+    ],
+)
+def test_resolve_ndjson_bad_lines(line, error):
+    stdin = f'"EXPOCODE"\n{line}\n["CTDPRS", "DBAR"]\n{{"key": "CTDPRS [DBAR]"}}\n'
+    first, bad, pair, obj = resolve(stdin, "-f", "ndjson")
+    assert first["key"] == "EXPOCODE"
+    assert bad["error"].startswith(error)
+    assert pair["input"] == ["CTDPRS", "DBAR"]
+    assert pair["key"] == obj["key"] == "CTDPRS [DBAR]"
+    assert obj["input"] == {"key": "CTDPRS [DBAR]"}
@@ -1,12 +1,15 @@
+import io
+import json
+import shutil
 import sqlite3
 import string
-from datetime import date, time
+from datetime import date, datetime, time
 from importlib.resources import as_file, files
 
 import pytest
-from jsonschema import validate
 
 import cchdo.params as data
+from cchdo.params.dump import check_dump, index_path, package_files, write_dump
 
 CF_VERSION = "81"
 
@@ -107,18 +110,74 @@ def test_whp_name_can_make_nc_attrs(whpname):
     assert isinstance(data, dict)
 
 
+@pytest.mark.parametrize(
+    "whpname", data.WHPNames.values(), ids=lambda x: f"{x.whp_name}_[{x.whp_unit}]"
+)
+def test_from_cf_attrs(whpname: data.WHPName):
+    attrs = whpname.get_nc_attrs()
+    standard_name = attrs.get("standard_name")
+    units = attrs.get("units")
+    if standard_name is None and units is None:
+        return
+
+    assert whpname in data.WHPNames.from_cf_attrs(standard_name, units)
+    if standard_name is not None:
+        assert whpname in data.WHPNames.from_cf_attrs(standard_name)
+    if units is not None:
+        assert whpname in data.WHPNames.from_cf_attrs(units=units)
+
+    if whpname.error_name is not None and standard_name is not None:
+        error_attrs = whpname.get_nc_attrs(error=True)
+        errors = data.WHPNames.from_cf_attrs(error_attrs["standard_name"], units)
+        assert whpname in errors
+        assert all(param.error_col for param in errors)
+
+
+def test_from_cf_attrs_batch():
+    variables = {
+        "pressure": {"standard_name": "sea_water_pressure", "units": "dbar"},
+        "cfc11": {"standard_name": "moles_per_unit_mass_of_cfc11_in_sea_water"},
+        "unknown": {"standard_name": "not_a_standard_name"},
+        "no_attrs": {"long_name": "something"},
+    }
+    results = data.WHPNames.from_cf_attrs_batch(variables)
+    assert data.WHPNames["CTDPRS [DBAR]"] in results["pressure"]
+    assert data.WHPNames["CFC-11 [PMOL/KG]"] in results["cfc11"]
+    assert results["unknown"] == ()
+    assert "no_attrs" not in results
+
+    with pytest.raises(ValueError):
+        data.WHPNames.from_cf_attrs()
+
+
 def test_db_dump_matches_files():
-    data = files("cchdo.params")
+    db, dump = package_files()
+    assert check_dump(db, dump) == []
 
-    db_file = []
-    with as_file(data / "params.sqlite3") as p:
-        with sqlite3.connect(p) as conn:
-            for line in conn.iterdump():
-                db_file.append(f"{line}\n")
-    db_file = "".join(db_file)
-    db_text = (data / "params.sqlite3.sql").read_text()
-    for db, text in zip(db_file.splitlines(), db_text.splitlines()):
-        assert db == text
+
+def test_db_dump_mismatch(tmp_path):
+    db, dump = package_files()
+    tmp_db = tmp_path / db.name
+    tmp_dump = tmp_path / dump.name
+    shutil.copy(db, tmp_db)
+    write_dump(tmp_db, tmp_dump)
+    assert check_dump(tmp_db, tmp_dump) == []
+
+    with sqlite3.connect(tmp_db) as conn:
+        conn.execute(
+            "UPDATE config SET value = 'changed' WHERE key = 'cf_version_number'"
+        )
+
+    mismatches = check_dump(tmp_db, tmp_dump)
+    assert [m.table for m in mismatches] == ["config"]
+    assert mismatches[0].only_in_database == (
+        "INSERT INTO \"config\" VALUES('cf_version_number','changed');\n",
+    )
+    assert len(mismatches[0].only_in_dump) == 1
+
+    # also works when the index is missing entirely
+    index_path(tmp_dump).unlink()
+    assert [m.table for m in check_dump(tmp_db, tmp_dump)] == ["config"]
 
 
 def test_db_fk_ok():
@@ -130,6 +189,113 @@ def test_db_fk_ok():
             assert len(cursor.fetchall()) == 0
 
 
+def test_db_engine_cached():
+    from cchdo.params.db import get_engine
+
+    assert get_engine() is get_engine()
+    assert get_engine() is get_engine(False)
+    assert get_engine() is get_engine(readonly=False)
+    assert get_engine(readonly=True) is get_engine(True)
+    assert get_engine() is not get_engine(readonly=True)
+
+
+def test_db_readonly():
+    from sqlalchemy import select, update
+    from sqlalchemy.exc import OperationalError
+
+    from cchdo.params.db import Config, database
+
+    with database(readonly=True) as session:
+        config = session.execute(select(Config)).scalars().all()
+        assert len(config) > 0
+
+        with pytest.raises(OperationalError):
+            session.execute(update(Config).values(value=Config.value))
+
+
+def test_db_readonly_sees_writes(tmp_path, monkeypatch):
+    from cchdo.params import db
+
+    copy = tmp_path / "params.sqlite3"
+    shutil.copy(db.database_path(), copy)
+    monkeypatch.setattr(db, "database_path", lambda: copy)
+    db._get_engine.cache_clear()
+    db._sessionmaker.cache_clear()
+    try:
+        with db.database(readonly=True) as session:
+            key = session.query(db.Config).first().key
+
+        with db.database() as session:
+            session.get(db.Config, key).value = "changed"
+            session.commit()
+
+        # a new session on the same cached read only engine sees the write
+        with db.database(readonly=True) as session:
+            assert session.get(db.Config, key).value == "changed"
+    finally:
+        db._get_engine.cache_clear()
+        db._sessionmaker.cache_clear()
+
+
+CF_XML = """<?xml version="1.0"?>
+<standard_name_table>
+  <version_number>999</version_number>
+  <last_modified>2026-01-01T00:00:00Z</last_modified>
+  <entry id="sea_water_pressure">
+    <canonical_units>Pa</canonical_units>
+    <grib></grib>
+    <amip></amip>
+    <description>changed</description>
+  </entry>
+  <entry id="new_name">
+    <canonical_units>1</canonical_units>
+  </entry>
+  <alias id="new_alias">
+    <entry_id>new_name</entry_id>
+  </alias>
+</standard_name_table>
+"""
+
+
+def test_cf_update_staging(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from cchdo.params.db import (
+        apply_cf_staging,
+        database_path,
+        diff_cf_staging,
+        stage_cf_xml,
+    )
+
+    db = tmp_path / "params.sqlite3"
+    shutil.copy(database_path(), db)
+    cf_xml = tmp_path / "cf.xml"
+    cf_xml.write_text(CF_XML)
+
+    with Session(create_engine(f"sqlite:///{db}")) as session:
+        info = stage_cf_xml(session, cf_xml)
+        assert info["version_number"] == "999"
+
+        report = diff_cf_staging(session)
+        assert report["cf_names"]["added"] == ["new_name"]
+        assert "sea_water_pressure" not in report["cf_names"]["removed"]
+        assert report["cf_names"]["changed"]["sea_water_pressure"] == {
+            "canonical_units": ["dbar", "Pa"],
+            "description": [
+                data.CFStandardNames["sea_water_pressure"].description,
+                "changed",
+            ],
+        }
+        assert report["cf_aliases"]["added"] == [["new_alias", "new_name"]]
+
+        apply_cf_staging(session)
+        assert diff_cf_staging(session) == {
+            "cf_names": {"added": [], "removed": [], "changed": {}},
+            "cf_aliases": {"added": [], "removed": []},
+        }
+
+
 allowed = set(string.ascii_lowercase + string.digits + "_")
 
 
@@ -142,8 +308,36 @@ def test_nc_names_ok(whpname):
 
 def test_legacy_json():
     # Validate will raise if this fails
-    validate(data.WHPNames.legacy_json, data.WHPNames.legacy_json_schema)
-    assert True
+    data.WHPNames.legacy_json_validator.validate(data.WHPNames.legacy_json)
+
+
+def test_legacy_json_serialized():
+    expected = json.dumps(data.WHPNames.legacy_json, indent=2, sort_keys=True)
+
+    assert "".join(data.WHPNames.iter_legacy_json()) == expected
+    assert data.WHPNames.legacy_json_bytes == expected.encode("utf8")
+
+    fp = io.StringIO()
+    data.WHPNames.dump_legacy_json(fp)
+    assert fp.getvalue() == expected
+
+
+def test_legacy_json_validator():
+    assert data.WHPNames.legacy_json_validator.is_valid(data.WHPNames.legacy_json)
+    assert data.WHPNames.legacy_json_validator.is_valid([]) is True
+    assert data.WHPNames.legacy_json_validator.is_valid({}) is False
+
+
+def test_legacy_json_record_validator():
+    validator = data.WHPNames.legacy_json_record_validator
+    for record in data.WHPNames.legacy_json:
+        validator.validate(record)
+
+    bad_record = {**data.WHPNames.legacy_json[0], "flag_w": "not_a_flag"}
+    assert validator.is_valid(bad_record) is False
+
+    expected = json.dumps(data.WHPNames.legacy_json, indent=2, sort_keys=True)
+    assert "".join(data.WHPNames.iter_legacy_json(validate=True)) == expected
 
 
 def test_whpname_groups():
@@ -320,3 +514,86 @@ def test_alt_depths_bad(whpname: data.WHPName, depth: int):
     with pytest.raises(ValueError):
         name = f"{whpname.whp_name}_ALT_{depth}"
         data.WHPNames[(name, whpname.whp_unit)]
+
+
+@pytest.mark.parametrize(
+    "whpname",
+    data.WHPNames.values(),
+    ids=lambda x: f"{x.whp_name}_[{x.whp_unit}]",
+)
+def test_formatter_matches_strfex(whpname: data.WHPName):
+    values = {
+        "string": ["", "  ", "abc", 12, float("nan"), date(2020, 1, 2), time(3, 4)],
+        "integer": [1, 123456, -5, 2.7, float("nan")],
+        "decimal": [0, 10, 10.15, -1.5, 1e12, float("nan")],
+    }[whpname.dtype]
+    overrides = [None] if whpname.dtype != "decimal" else [None, 0, 3]
+    for override in overrides:
+        formatter = whpname.formatter(numeric_precision_override=override)
+        assert formatter is whpname.formatter(numeric_precision_override=override)
+        for value in values:
+            assert formatter(value) == whpname.strfex(
+                value, numeric_precision_override=override
+            )
+
+    flag_formatter = whpname.formatter(flag=True)
+    for value in (2, 9.0, float("nan")):
+        assert flag_formatter(value) == whpname.strfex(value, flag=True)
+
+    wide = whpname.formatter(field_width_override=20)
+    for value in values:
+        assert wide(value) == whpname.strfex(value, field_width_override=20)
+
+    if whpname.dtype == "string":
+        dates_and_times = [date(2020, 1, 2), datetime(2020, 1, 2, 3, 4), time(3, 4)]
+        for date_or_time in ("date", "time"):
+            formatter = whpname.formatter(date_or_time=date_or_time)
+            for value in dates_and_times:
+                if date_or_time == "date" and isinstance(value, time):
+                    continue  # not a valid input for a date column
+                assert formatter(value) == whpname.strfex(
+                    value, date_or_time=date_or_time
+                )
+        assert whpname.formatter(date_or_time="time")(time(3, 4)) == "0304"
+        assert (
+            whpname.formatter(date_or_time="time")(datetime(2020, 1, 2, 3, 4))
+            == "20200102"
+        )
+
+
+@pytest.mark.parametrize("alias,canonical", cf_alias_data)
+def test_cf_standard_name_alias_index(alias, canonical):
+    assert data.CFStandardNames.is_alias(alias)
+    assert not data.CFStandardNames.is_alias(canonical)
+    assert data.CFStandardNames.aliases[alias] == canonical
+    assert data.CFStandardNames.canonical(alias) == canonical
+    assert data.CFStandardNames.canonical(canonical) == canonical
+
+
+def test_cf_standard_name_aliases_complete():
+    aliases = data.CFStandardNames.aliases
+    for key, cf_name in data.CFStandardNames.items():
+        assert (key in aliases) == (key != cf_name.name)
+    assert set(aliases.values()) <= data.CFStandardNames.keys()
+    with pytest.raises(KeyError):
+        data.CFStandardNames.canonical("not_a_standard_name")
+
+
+def test_cf_standard_name_reverse_indexes():
+    canonical = [
+        cf_name for key, cf_name in data.CFStandardNames.items() if key == cf_name.name
+    ]
+    for cf_name in canonical:
+        if cf_name.canonical_units is not None:
+            assert cf_name in data.CFStandardNames.by_canonical_units(
+                cf_name.canonical_units
+            )
+        for code in (cf_name.grib or "").split():
+            assert cf_name in data.CFStandardNames.by_grib(code)
+        for code in (cf_name.amip or "").split():
+            assert cf_name in data.CFStandardNames.by_amip(code)
+
+    assert sum(
+        len(names) for names in data.CFStandardNames._reverse_indexes["amip"].values()
+    ) == sum(len((cf_name.amip or "").split()) for cf_name in canonical)
+    assert data.CFStandardNames.by_grib("not a code") == ()
@@ -0,0 +1,156 @@
+import pytest
+
+from cchdo.params.header import (
+    _parse_header,
+    canonical_header,
+    header_fingerprint,
+    header_plan,
+    parse_header,
+)
+
+PARAMS = "EXPOCODE,STNNBR,CTDPRS,CTDTMP,CTDTMP_FLAG_W,SALNTY,SALNTY_FLAG_W"
+UNITS = ",,DBAR,ITS-90,,PSS-78,"
+
+
+def test_fingerprint_canonical():
+    fingerprint = header_fingerprint(PARAMS, UNITS)
+    assert header_fingerprint(PARAMS.split(","), UNITS.split(",")) == fingerprint
+    assert header_fingerprint(f"{PARAMS},\r\n", f" {UNITS},\n") == fingerprint
+    assert header_fingerprint(PARAMS, UNITS.replace("ITS-90", "IPTS-68")) != fingerprint
+
+
+def test_canonical_header_mismatch():
+    with pytest.raises(ValueError):
+        canonical_header("EXPOCODE,CTDPRS", ",DBAR,ITS-90")
+
+
+def test_header_plan(whpnames):
+    plan = header_plan(PARAMS, UNITS, whpnames)
+    assert plan.fingerprint == header_fingerprint(PARAMS, UNITS)
+    assert plan.params == (
+        whpnames["EXPOCODE"],
+        whpnames["STNNBR"],
+        whpnames["CTDPRS [DBAR]"],
+        whpnames["CTDTMP [ITS-90]"],
+        whpnames["CTDTMP [ITS-90]_FLAG_W"],
+        whpnames["SALNTY [PSS-78]"],
+        whpnames["SALNTY [PSS-78]_FLAG_W"],
+    )
+    assert [column.index for column in plan.columns] == list(range(7))
+    assert [column.param.flag_col for column in plan.columns] == [
+        False,
+        False,
+        False,
+        False,
+        True,
+        False,
+        True,
+    ]
+
+    ctdtmp, ctdtmp_flag = plan.columns[3:5]
+    assert ctdtmp.parse(" 12.3456") == 12.3456
+    assert ctdtmp.format(12.3456) == ctdtmp.param.strfex(12.3456)
+    assert ctdtmp_flag.parse("2") == 2
+    assert ctdtmp_flag.format(2) == "2"
+
+
+def test_header_plan_cached(whpnames):
+    plan = header_plan(PARAMS, UNITS, whpnames)
+    assert header_plan(PARAMS.split(","), UNITS.split(","), whpnames) is plan
+
+
+def test_header_plan_alias_invalidates(whpnames):
+    with pytest.raises(KeyError):
+        header_plan("EXPOCODE,MYTEMP", ",", whpnames)
+    plan = header_plan("EXPOCODE", "", whpnames)
+
+    whpnames.add_alias(("MYTEMP", None), ("CTDTMP", "ITS-90"))
+    assert header_plan("EXPOCODE", "", whpnames) is not plan
+    assert (
+        header_plan("EXPOCODE,MYTEMP", ",", whpnames).params[1]
+        == whpnames["CTDTMP [ITS-90]"]
+    )
+
+
+def test_parse_header_roles(whpnames):
+    columns = parse_header(
+        "CTDPRS,CTDTMP,CTDTMP_ALT_1,CTDTMP_ALT_1_FLAG_W,DELC14,C14ERR,DELC14_FLAG_W",
+        "DBARS,ITS-90,ITS-90,,/MILLE,/MILLE,",
+        whpnames,
+    )
+    assert [column.role for column in columns] == [
+        "data",
+        "data",
+        "data",
+        "flag",
+        "data",
+        "error",
+        "flag",
+    ]
+    assert [column.base_index for column in columns] == [
+        None,
+        None,
+        None,
+        2,
+        None,
+        4,
+        4,
+    ]
+    # the alias is resolved, but the column keeps what was written
+    assert columns[0].param == whpnames["CTDPRS [DBAR]"]
+    assert columns[0].unit == "DBARS"
+    assert columns[2].param.alt_depth == 1
+    assert columns[3].param.alt_depth == 1
+    assert columns[3].unit == "ITS-90"
+    assert columns[5].param.error_col is True
+
+
+@pytest.mark.parametrize(
+    "params,units",
+    [
+        ("CTDTMP_FLAG_W,CTDTMP", ",ITS-90"),
+        ("CTDPRS,CTDTMP,CTDTMP", "DBAR,ITS-90,ITS-90"),
+        ("CTDPRS,CTDPRS", "DBAR,DBARS"),
+        ("CTDTMP,CTDTMP_FLAG_W,CTDTMP_FLAG_W", "ITS-90,,"),
+    ],
+)
+def test_parse_header_invalid(whpnames, params, units):
+    with pytest.raises(ValueError):
+        parse_header(params, units, whpnames)
+
+
+def test_parse_header_strict(whpnames):
+    params = "CTDTMP,CTDSAL,CTDTMP_FLAG_W"
+    units = "ITS-90,PSS-78,"
+    assert parse_header(params, units, whpnames)[2].base_index == 0
+    with pytest.raises(ValueError):
+        parse_header(params, units, whpnames, strict=True)
+    with pytest.raises(ValueError):
+        header_plan(params, units, whpnames, strict=True)
+
+    # the error column may sit between the data and its flag
+    parse_header("DELC14,C14ERR,DELC14_FLAG_W", "/MILLE,/MILLE,", whpnames, strict=True)
+
+
+def test_parse_header_unknown(whpnames):
+    with pytest.raises(KeyError):
+        parse_header("CTDPRS,NOTAPARAM", "DBAR,", whpnames)
+
+
+def test_parse_header_collect_unknown(whpnames):
+    header = canonical_header(
+        "NOTAPARAM,NOTAPARAM_FLAG_W,CTDPRS,CTDPRS_FLAG_W", "UNIT,,DBAR,"
+    )
+    unknown = []
+    columns = _parse_header(whpnames, header, False, unknown)
+    assert [(c.index, c.role, c.base_index) for c in columns] == [
+        (2, "data", None),
+        (3, "flag", 2),
+    ]
+    assert [(index, name, unit) for index, name, unit, _ in unknown] == [
+        (0, "NOTAPARAM", "UNIT"),
+        (1, "NOTAPARAM_FLAG_W", "UNIT"),
+    ]
+
+    with pytest.raises(KeyError):
+        _parse_header(whpnames, header, False)
@@ -0,0 +1,103 @@
+import pytest
+
+import cchdo.params as data
+
+ALL = frozenset(data.WHPNames.values())
+
+
+def test_where_matches_scan():
+    expected = frozenset(
+        param
+        for param in ALL
+        if param.flag_w == "woce_ctd" and param.dtype == "decimal"
+    )
+    assert data.WHPNames.where(flag_w="woce_ctd", dtype="decimal") == expected
+
+
+def test_where_in_erddap():
+    assert data.WHPNames.where(in_erddap=True) == frozenset(
+        param for param in ALL if param.in_erddap
+    )
+
+
+def test_where_any_of():
+    expected = frozenset(
+        param for param in ALL if param.whp_unit in {"UMOL/KG", "UMOL/L"}
+    )
+    assert data.WHPNames.where(whp_unit={"UMOL/KG", "UMOL/L"}) == expected
+
+
+def test_where_no_criteria():
+    assert data.WHPNames.where() == ALL
+
+
+def test_where_no_match():
+    assert data.WHPNames.where(whp_name="NOT_A_PARAM") == frozenset()
+    assert data.WHPNames.where(whp_name="CTDPRS", whp_unit="PSS-78") == frozenset()
+
+
+def test_where_bad_field():
+    with pytest.raises(ValueError):
+        data.WHPNames.where(not_a_field=1)
+
+
+def test_having():
+    expected = frozenset(param for param in ALL if param.error_name is not None)
+    assert data.WHPNames.having("error_name") == expected
+    assert data.WHPNames.having() == ALL
+
+
+def test_nc_group_composed():
+    groups = {param.nc_group for param in ALL if param.nc_group is not None}
+    for group in groups:
+        expected = frozenset(
+            param for param in ALL if param.nc_group == group and param.in_erddap
+        )
+        assert (
+            data.WHPNames.where(nc_group=group) & data.WHPNames.where(in_erddap=True)
+            == expected
+        )
+
+
+@pytest.mark.parametrize(
+    "low,high", [(None, None), (400, 500), (None, 450), (450, None), (700, 700)]
+)
+def test_in_range(low, high):
+    expected = frozenset(
+        param
+        for param in ALL
+        if param.radiation_wavelength is not None
+        and (low is None or param.radiation_wavelength >= low)
+        and (high is None or param.radiation_wavelength <= high)
+    )
+    assert data.WHPNames.in_range("radiation_wavelength", low, high) == expected
+
+
+def test_columns():
+    columns = data.WHPNames.columns
+    params = sorted(ALL)
+    assert len(columns["whp_name"]) == len(params)
+    for name, column in columns.items():
+        assert column == tuple(getattr(param, name) for param in params)
+    assert "flag_col" not in columns
+
+
+def test_to_numpy():
+    np = pytest.importorskip("numpy")
+
+    table = data.WHPNames.to_numpy()
+    assert table is data.WHPNames.to_numpy()
+    assert table.flags.writeable is False
+    assert table.dtype.names == tuple(data.WHPNames.columns)
+
+    columns = data.WHPNames.columns
+    assert table["whp_name"].tolist() == list(columns["whp_name"])
+    assert table["field_width"].tolist() == list(columns["field_width"])
+    assert table["in_erddap"].tolist() == list(columns["in_erddap"])
+    np.testing.assert_array_equal(
+        table["numeric_precision"],
+        [np.nan if v is None else v for v in columns["numeric_precision"]],
+    )
+    assert table["whp_unit"].tolist() == [
+        "" if v is None else v for v in columns["whp_unit"]
+    ]
@@ -0,0 +1,100 @@
+import pytest
+
+import cchdo.params as data
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("ctd pressure", "CTDPRS [DBAR]"),
+        ("CTDPRS", "CTDPRS [DBAR]"),
+        ("pressure", "CTDPRS [DBAR]"),
+        ("sea_water_practical_salinity", "CTDSAL [PSS-78]"),
+        ("nitrat", "NITRAT [UMOL/KG]"),
+    ],
+)
+def test_search_whp(query, expected):
+    keys = [hit.key for hit in data.search(query, kind="whp")]
+    assert expected in keys
+
+
+def test_search_cf():
+    hits = data.search("sea water pressure", kind="cf")
+    assert len(hits) > 0
+    assert all(hit.kind == "cf" for hit in hits)
+    assert "sea_water_pressure" in [hit.key for hit in hits]
+    assert isinstance(hits[0].item, data.CFStandardName)
+
+
+def test_search_ranked():
+    hits = data.search("oxygen", limit=50)
+    assert len(hits) == 50
+    scores = [hit.score for hit in hits]
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("query", ["", "   ", "[]*", "_"])
+def test_search_empty(query):
+    assert data.search(query) == []
+
+
+def test_search_no_match():
+    assert data.search("qwertyuiopasdfgh") == []
+
+
+@pytest.mark.parametrize(
+    "prefix,expected",
+    [
+        ("CTDPRS", "CTDPRS [DBAR]"),
+        ("ctdprs [d", "CTDPRS [DBAR]"),
+        ("ctd_pres", "ctd_pressure_raw"),
+        ("nitrat", "NITRAT [UMOL/KG]"),
+        ("SEA_WATER_PRESSURE", "sea_water_pressure"),
+        ("sea_floor_depth", "sea_floor_depth"),
+    ],
+)
+def test_complete(prefix, expected):
+    completions = data.complete(prefix, limit=100)
+    assert expected in [c.text for c in completions]
+    assert all(c.text.casefold().startswith(prefix.casefold()) for c in completions)
+
+
+def test_complete_matches_scan():
+    texts = {param.odv_key for param in data.WHPNames.values()}
+    texts |= {param.nc_name for param in data.WHPNames.values()}
+    texts |= {key for key in data.CFStandardNames if key is not None}
+    for prefix in ["s", "sea_water_", "CTD", "o", "tendency_of_"]:
+        expected = {
+            t.casefold() for t in texts if t.casefold().startswith(prefix.casefold())
+        }
+        completions = data.complete(prefix, limit=len(texts))
+        assert {c.text.casefold() for c in completions} == expected
+
+
+def test_complete_ranked():
+    completions = data.complete("ctd", limit=100, kind="whp")
+    ranks = [c.item.rank for c in completions]
+    assert ranks == sorted(ranks)
+    assert completions[0].key == "CTDPRS [DBAR]"
+
+    mixed = data.complete("o", limit=1000)
+    kinds = [c.kind for c in mixed]
+    assert kinds == sorted(kinds, key=lambda kind: kind != "whp")
+    cf_texts = [c.text for c in mixed if c.kind == "cf"]
+    assert cf_texts == sorted(cf_texts, key=str.casefold)
+
+
+def test_complete_alias():
+    (completion,) = data.complete("sea_floor_depth", kind="cf", limit=1)
+    assert completion.text == "sea_floor_depth"
+    assert completion.key == "sea_floor_depth_below_geoid"
+    assert isinstance(completion.item, data.CFStandardName)
+
+
+@pytest.mark.parametrize("limit", [0, 1, 5])
+def test_complete_limit(limit):
+    assert len(data.complete("s", limit=limit)) == limit
+
+
+def test_complete_no_match():
+    assert data.complete("qwertyuiop") == []
@@ -0,0 +1,172 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import pytest
+
+from cchdo.params._service import ParamsService
+
+
+@pytest.fixture
+def service(whpnames):
+    return ParamsService(whpnames)
+
+
+def test_resolve_get(service):
+    status, body = service.handle("GET", "/resolve?key=CTDPRS%20%5BDBARS%5D", b"")
+    assert status == HTTPStatus.OK
+    (record,) = json.loads(body)
+    assert record["key"] == "CTDPRS [DBAR]"
+    assert record["nc_name"] == "pressure"
+    assert record["alias"] == ["CTDPRS", "DBARS"]
+    assert record["error"] is None
+
+
+def test_resolve_batch(service):
+    keys = ["CTDTMP_ALT_1 [ITS-90]_FLAG_W", ["C14ERR", "/MILLE"], "NOTAPARAM"]
+    status, body = service.handle("POST", "/resolve", json.dumps(keys).encode())
+    assert status == HTTPStatus.OK
+    flag, error, unknown = json.loads(body)
+    assert flag["flag_col"] is True
+    assert flag["alt_depth"] == 1
+    assert flag["nc_name"] == "ctd_temperature_alt_1_qc"
+    assert error["error_col"] is True
+    assert error["input"] == ["C14ERR", "/MILLE"]
+    assert unknown["error"].startswith("KeyError")
+
+
+def test_nc_attrs(service, whpnames):
+    status, body = service.handle(
+        "POST", "/nc_attrs", b'[{"key": "CTDPRS [DBAR]", "error": true}, "EXPOCODE"]'
+    )
+    assert status == HTTPStatus.OK
+    ctdprs, expocode = json.loads(body)
+    assert ctdprs["attrs"] == whpnames["CTDPRS [DBAR]"].get_nc_attrs(error=True)
+    assert expocode["attrs"] == whpnames["EXPOCODE"].get_nc_attrs()
+
+
+def test_search(service):
+    status, body = service.handle("GET", "/search?q=ctd+pressure&limit=1", b"")
+    assert status == HTTPStatus.OK
+    assert [hit["key"] for hit in json.loads(body)] == ["CTDPRS [DBAR]"]
+
+
+def test_complete(service):
+    status, body = service.handle("GET", "/complete?prefix=ctdpr&kind=whp", b"")
+    assert status == HTTPStatus.OK
+    assert json.loads(body) == [
+        {"text": "CTDPRS [DBAR]", "kind": "whp", "key": "CTDPRS [DBAR]"}
+    ]
+
+    status, body = service.handle(
+        "POST", "/complete", b'["sea_water_pres", {"prefix": "ctd", "limit": 2}]'
+    )
+    assert status == HTTPStatus.OK
+    sea_water, ctd = json.loads(body)
+    assert all(c["text"].startswith("sea_water_pres") for c in sea_water)
+    assert len(ctd) == 2
+
+
+def test_legacy_json(service, whpnames):
+    status, body = service.handle("GET", "/legacy_json", b"")
+    assert status == HTTPStatus.OK
+    assert body == whpnames.legacy_json_bytes
+
+
+@pytest.mark.parametrize(
+    "method,target,body,expected",
+    [
+        ("GET", "/nope", b"", HTTPStatus.NOT_FOUND),
+        ("POST", "/resolve", b"{", HTTPStatus.BAD_REQUEST),
+        ("POST", "/resolve", b'{"key": "EXPOCODE"}', HTTPStatus.BAD_REQUEST),
+        ("GET", "/search", b"", HTTPStatus.BAD_REQUEST),
+        (
+            "POST",
+            "/nc_attrs",
+            b'[{"key": "CTDPRS", "error": "false"}]',
+            HTTPStatus.BAD_REQUEST,
+        ),
+        (
+            "POST",
+            "/nc_attrs",
+            b'[{"key": "CTDPRS", "error": 1}]',
+            HTTPStatus.BAD_REQUEST,
+        ),
+        ("GET", "/complete?prefix=ctd&kind=odv", b"", HTTPStatus.BAD_REQUEST),
+        ("POST", "/complete", b"[5]", HTTPStatus.BAD_REQUEST),
+        ("POST", "/complete", b'[{"prefix": null}]', HTTPStatus.BAD_REQUEST),
+        ("DELETE", "/resolve", b"", HTTPStatus.METHOD_NOT_ALLOWED),
+        ("POST", "/legacy_json", b"[]", HTTPStatus.METHOD_NOT_ALLOWED),
+    ],
+)
+def test_errors(service, method, target, body, expected):
+    status, response = service.handle(method, target, body)
+    assert status == expected
+    assert "error" in json.loads(response)
+
+
+def test_keep_alive(service):
+    async def exchange():
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        bodies = []
+        for connection in ("keep-alive", "close"):
+            payload = b'["EXPOCODE"]'
+            writer.write(
+                b"POST /resolve HTTP/1.1\r\nHost: localhost\r\n"
+                + f"Connection: {connection}\r\n".encode()
+                + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            assert status_line == b"HTTP/1.1 200 OK\r\n"
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                name, _, value = line.decode().partition(":")
+                headers[name.lower()] = value.strip()
+            assert headers["connection"] == connection
+            bodies.append(await reader.readexactly(int(headers["content-length"])))
+        # the server closed the connection after the second request
+        assert await reader.read() == b""
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return bodies
+
+    bodies = asyncio.run(exchange())
+    assert [json.loads(body)[0]["key"] for body in bodies] == ["EXPOCODE", "EXPOCODE"]
+
+
+def test_idle_timeout(whpnames):
+    service = ParamsService(whpnames, idle_timeout=0.05)
+
+    async def idle():
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        # no request is sent, the server gives up and closes the connection
+        closed = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return closed
+
+    assert asyncio.run(idle()) == b""
+
+
+def test_warm(service, whpnames):
+    whpnames.__dict__.pop("legacy_json_bytes", None)
+    service.warm()
+    assert "legacy_json_bytes" in whpnames.__dict__
+
+
+def test_internal_error(service, monkeypatch):
+    def broken(method, query, body):
+        raise AttributeError("bug")
+
+    monkeypatch.setitem(service._routes, "/resolve", broken)
+    status, body = service.handle("GET", "/resolve?key=EXPOCODE", b"")
+    assert status == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert json.loads(body) == {"error": "internal server error"}
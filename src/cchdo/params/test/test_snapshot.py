@@ -0,0 +1,96 @@
+import pytest
+
+from cchdo.params import WHPNames
+from cchdo.params.snapshot import RegistrySnapshot, diff_snapshots
+
+
+@pytest.fixture(scope="module")
+def current():
+    return RegistrySnapshot.from_whpnames(label="current")
+
+
+def test_snapshot_contents(current):
+    assert len(current) == len(set(WHPNames.values()))
+    assert ("CTDPRS", "DBAR") in current
+    assert "CTDPRS [DBARS]" in current
+    assert current["CTDPRS [DBARS]"] is current[("CTDPRS", "DBAR")]
+    assert "NOT_A_PARAM" not in current
+
+
+@pytest.mark.parametrize("name", ["snapshot.json", "snapshot.json.gz"])
+def test_save_load(tmp_path, current, name):
+    current.save(tmp_path / name)
+    loaded = RegistrySnapshot.load(tmp_path / name)
+
+    assert loaded.label == "current"
+    assert loaded.fields == current.fields
+    assert loaded.records == current.records
+    assert loaded.aliases == current.aliases
+    assert not diff_snapshots(current, loaded)
+
+
+def test_legacy_json_matches_current(current):
+    legacy = RegistrySnapshot.from_legacy_json(WHPNames.legacy_json, label="legacy")
+
+    assert legacy.aliases is None
+    assert legacy.fields < current.fields
+    assert not diff_snapshots(legacy, current)
+
+
+def test_legacy_json_file(tmp_path, current):
+    path = tmp_path / "legacy.json"
+    with path.open("w") as f:
+        WHPNames.dump_legacy_json(f)
+
+    legacy = RegistrySnapshot.load(path)
+    assert legacy.label == "legacy.json"
+    assert legacy.records.keys() == current.records.keys()
+
+
+def test_diff(current):
+    records = dict(current.records)
+    del records[("CTDPRS", "DBAR")]
+    records[("CTDTMP", "ITS-90")] = dict(
+        records[("CTDTMP", "ITS-90")], numeric_precision=6, cf_name=None
+    )
+    records[("NEWPARAM", None)] = dict(records[("EXPOCODE", None)], whp_name="NEWPARAM")
+    aliases = dict(current.aliases)
+    removed_alias = next(iter(aliases))
+    del aliases[removed_alias]
+    aliases[("CTDTMP", "DEG C")] = ("CTDTMP", "ITS-90")
+    new = RegistrySnapshot(records.values(), current.fields, aliases, "new")
+
+    diff = diff_snapshots(current, new)
+    assert diff
+    assert (diff.old_label, diff.new_label) == ("current", "new")
+    assert diff.added == (("NEWPARAM", None),)
+    assert diff.removed == (("CTDPRS", "DBAR"),)
+    assert list(diff.changed) == [("CTDTMP", "ITS-90")]
+    assert diff.fields == {"numeric_precision", "cf_name"}
+    (change,) = diff.by_field("numeric_precision")
+    assert (change.old, change.new) == (4, 6)
+    assert diff.by_field("whp_number") == ()
+    assert diff.aliases_added == {("CTDTMP", "DEG C"): ("CTDTMP", "ITS-90")}
+    assert diff.aliases_removed == {removed_alias: current.aliases[removed_alias]}
+
+    only_precision = diff_snapshots(current, new, fields=["numeric_precision"])
+    assert only_precision.fields == {"numeric_precision"}
+
+
+def test_diff_unknown_fields(current):
+    legacy = RegistrySnapshot.from_legacy_json(WHPNames.legacy_json)
+    with pytest.raises(ValueError):
+        diff_snapshots(legacy, current, fields=["nc_name"])
+
+
+def test_duplicate_records(current):
+    record = current[("CTDPRS", "DBAR")]
+    with pytest.raises(ValueError):
+        RegistrySnapshot([record, record])
+
+
+def test_load_unsupported_version(tmp_path):
+    path = tmp_path / "snapshot.json"
+    path.write_text('{"version": 99}')
+    with pytest.raises(ValueError):
+        RegistrySnapshot.load(path)
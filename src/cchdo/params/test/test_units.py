@@ -0,0 +1,72 @@
+import pytest
+
+import cchdo.params as data
+from cchdo.params.units import UnitConversion, param_conversion, unit_conversion
+
+
+@pytest.mark.parametrize(
+    "from_unit,to_unit,expected",
+    [
+        ("nmol/l", "pmol/l", UnitConversion(1000.0)),
+        ("pmol/kg", "fmol/kg", UnitConversion(1000.0)),
+        ("umol l-1", "umol/l", UnitConversion(1.0)),
+        ("mg/m^3", "ug/l", UnitConversion(1.0)),
+        ("kBq m-3", "Bq m-3", UnitConversion(1000.0)),
+        ("0.000166 Bq/kg", "mBq kg-1", UnitConversion(0.166)),
+        ("millivolts", "volts", UnitConversion(0.001)),
+        ("degC", "K", UnitConversion(1.0, 273.15)),
+        ("percent", "1", UnitConversion(0.01)),
+    ],
+)
+def test_unit_conversion(from_unit, to_unit, expected):
+    assert unit_conversion(from_unit, to_unit) == expected
+
+
+@pytest.mark.parametrize(
+    "from_unit,to_unit",
+    [
+        ("umol/kg", "umol l-1"),
+        ("ug/l", "umol l-1"),
+        ("1e-18", "kBq m-3"),
+        ("degC m", "K m"),
+        ("furlongs", "m"),
+        ("", "1"),
+    ],
+)
+def test_unit_conversion_invalid(from_unit, to_unit):
+    with pytest.raises(ValueError):
+        unit_conversion(from_unit, to_unit)
+
+
+def test_all_cf_units_parse():
+    for param in set(data.WHPNames.values()):
+        if param.cf_unit is not None:
+            assert unit_conversion(param.cf_unit, param.cf_unit) == UnitConversion(1.0)
+
+
+def test_param_conversion():
+    convert = param_conversion(
+        data.WHPNames["CTDORP [MILLIVOLTS]"], data.WHPNames["CTDORP [VOLTS]"]
+    )
+    assert convert == UnitConversion(0.001)
+    assert convert(1500) == 1.5
+
+
+def test_param_conversion_vectorized():
+    np = pytest.importorskip("numpy")
+    convert = unit_conversion("nmol/l", "pmol/l")
+    result = convert(np.array([1.0, np.nan, 0.25]))
+    np.testing.assert_array_equal(result, [1000.0, np.nan, 250.0])
+
+
+@pytest.mark.parametrize(
+    "from_key,to_key",
+    [
+        ("OXYGEN [UMOL/KG]", "CTDPRS [DBAR]"),
+        ("CTDOXY [UMOL/KG]", "CTDOXY [UMOL/L]"),
+        ("CTDTMP [ITS-90]", "CTDTMP [IPTS-68]"),
+    ],
+)
+def test_param_conversion_invalid(from_key, to_key):
+    with pytest.raises(ValueError):
+        param_conversion(data.WHPNames[from_key], data.WHPNames[to_key])
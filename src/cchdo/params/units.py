@@ -0,0 +1,181 @@
+"""Conversions between the units of WHPNames using their UDUNITS compatible ``cf_unit``
+
+Only a small pure python subset of UDUNITS is understood, enough for the units in this database:
+products of (optionally prefixed) unit symbols with integer powers, ``/`` for division, and numeric scale factors.
+A conversion only exists where the two units have the same dimensions,
+e.g. ``nmol/l`` to ``pmol/l``, but not ``umol/kg`` to ``umol l-1`` which would need a density.
+"""
+
+import re
+from functools import cache
+from typing import NamedTuple
+
+from .core import WHPName
+
+# dimension order: mass, length, time, amount of substance, electric current, temperature
+_Dims = tuple[int, int, int, int, int, int]
+_NONE: _Dims = (0, 0, 0, 0, 0, 0)
+
+# symbol: (scale to SI, offset to SI, dimensions)
+_UNITS: dict[str, tuple[float, float, _Dims]] = {
+    "1": (1.0, 0.0, _NONE),
+    "percent": (1e-2, 0.0, _NONE),
+    "sr": (1.0, 0.0, _NONE),
+    "g": (1e-3, 0.0, (1, 0, 0, 0, 0, 0)),
+    "m": (1.0, 0.0, (0, 1, 0, 0, 0, 0)),
+    "meters": (1.0, 0.0, (0, 1, 0, 0, 0, 0)),
+    "l": (1e-3, 0.0, (0, 3, 0, 0, 0, 0)),
+    "L": (1e-3, 0.0, (0, 3, 0, 0, 0, 0)),
+    "s": (1.0, 0.0, (0, 0, 1, 0, 0, 0)),
+    "seconds": (1.0, 0.0, (0, 0, 1, 0, 0, 0)),
+    "min": (60.0, 0.0, (0, 0, 1, 0, 0, 0)),
+    "h": (3600.0, 0.0, (0, 0, 1, 0, 0, 0)),
+    "day": (86400.0, 0.0, (0, 0, 1, 0, 0, 0)),
+    "mol": (1.0, 0.0, (0, 0, 0, 1, 0, 0)),
+    "A": (1.0, 0.0, (0, 0, 0, 0, 1, 0)),
+    "K": (1.0, 0.0, (0, 0, 0, 0, 0, 1)),
+    "degC": (1.0, 273.15, (0, 0, 0, 0, 0, 1)),
+    "Bq": (1.0, 0.0, (0, 0, -1, 0, 0, 0)),
+    "Pa": (1.0, 0.0, (1, -1, -2, 0, 0, 0)),
+    "bar": (1e5, 0.0, (1, -1, -2, 0, 0, 0)),
+    "dbar": (1e4, 0.0, (1, -1, -2, 0, 0, 0)),
+    "atm": (101325.0, 0.0, (1, -1, -2, 0, 0, 0)),
+    "V": (1.0, 0.0, (1, 2, -3, 0, -1, 0)),
+    "volts": (1.0, 0.0, (1, 2, -3, 0, -1, 0)),
+    "millivolts": (1e-3, 0.0, (1, 2, -3, 0, -1, 0)),
+}
+_PREFIXES = {
+    "f": 1e-15,
+    "p": 1e-12,
+    "n": 1e-9,
+    "u": 1e-6,
+    "µ": 1e-6,
+    "m": 1e-3,
+    "c": 1e-2,
+    "d": 1e-1,
+    "k": 1e3,
+    "M": 1e6,
+    "G": 1e9,
+}
+_FACTOR_RE = re.compile(r"^(?P<symbol>[^\d\^+-]+)\^?(?P<power>[+-]?\d+)?$")
+
+
+class UnitConversion(NamedTuple):
+    """A linear conversion ``to = from * scale + offset``
+
+    Calling an instance applies it, this works equally on scalars and numpy arrays:
+
+    >>> UnitConversion(1e-3, 0.0)(1500.0)
+    1.5
+    """
+
+    scale: float
+    offset: float = 0.0
+
+    def __call__(self, values):
+        if self.offset == 0:
+            return values * self.scale
+        return values * self.scale + self.offset
+
+
+def _parse_symbol(symbol: str) -> tuple[float, float, _Dims]:
+    if symbol in _UNITS:
+        return _UNITS[symbol]
+    prefix, rest = symbol[:1], symbol[1:]
+    if prefix in _PREFIXES and rest in _UNITS:
+        scale, offset, dims = _UNITS[rest]
+        if offset == 0:
+            return _PREFIXES[prefix] * scale, offset, dims
+    raise ValueError(f"unknown unit symbol {symbol!r}")
+
+
+@cache
+def parse_unit(unit: str) -> tuple[float, float, _Dims]:
+    """Parse a UDUNITS style unit string into its (scale, offset, dimensions) relative to SI units
+
+    >>> parse_unit("umol l-1")
+    (0.001, 0.0, (0, -3, 0, 1, 0, 0))
+    >>> parse_unit("degC")
+    (1.0, 273.15, (0, 0, 0, 0, 0, 1))
+    """
+    scale = 1.0
+    offset = 0.0
+    dims = [0] * len(_NONE)
+    factors = 0
+    for term in unit.split():
+        for position, part in enumerate(term.split("/")):
+            sign = 1 if position == 0 else -1
+            if part == "":
+                raise ValueError(f"could not parse unit {unit!r}")
+            factors += 1
+            try:
+                scale *= float(part) ** sign
+                continue
+            except ValueError:
+                pass
+            if (match := _FACTOR_RE.match(part)) is None:
+                raise ValueError(f"could not parse unit {unit!r}")
+            power = sign * int(match.group("power") or 1)
+            sym_scale, sym_offset, sym_dims = _parse_symbol(match.group("symbol"))
+            scale *= sym_scale**power
+            if sym_offset != 0:
+                if power != 1:
+                    raise ValueError(
+                        f"units with an offset cannot have a power: {unit!r}"
+                    )
+                offset = sym_offset
+            for i, dim in enumerate(sym_dims):
+                dims[i] += dim * power
+
+    if factors == 0:
+        raise ValueError("empty unit")
+    if offset != 0 and factors != 1:
+        raise ValueError(f"units with an offset cannot be combined: {unit!r}")
+    return scale, offset, tuple(dims)  # type: ignore[return-value]
+
+
+@cache
+def unit_conversion(from_unit: str, to_unit: str) -> UnitConversion:
+    """Compile the conversion between two UDUNITS style unit strings
+
+    >>> unit_conversion("nmol/l", "pmol/l")
+    UnitConversion(scale=1000.0, offset=0.0)
+
+    :raises ValueError: if either unit cannot be parsed or they have different dimensions
+    """
+    from_scale, from_offset, from_dims = parse_unit(from_unit)
+    to_scale, to_offset, to_dims = parse_unit(to_unit)
+    if from_dims != to_dims:
+        raise ValueError(f"{from_unit!r} cannot be converted to {to_unit!r}")
+
+    # avoid floating point noise for exact powers of ten
+    scale = float(f"{from_scale / to_scale:.15g}")
+    offset = float(f"{(from_offset - to_offset) / to_scale:.15g}")
+    return UnitConversion(scale, offset)
+
+
+def param_conversion(from_param: WHPName, to_param: WHPName) -> UnitConversion:
+    """Compile the conversion of values of `from_param` into the units of `to_param`
+
+    Both must be the same parameter (have the same ``whp_name``) reported in different units,
+    have a ``cf_unit``, and have the same ``reference_scale``.
+
+    >>> from cchdo.params import WHPNames
+    >>> convert = param_conversion(WHPNames["CTDORP [MILLIVOLTS]"], WHPNames["CTDORP [VOLTS]"])
+    >>> convert(250.0)
+    0.25
+
+    :raises ValueError: if no pure scale and offset conversion exists
+    """
+    if from_param.whp_name != to_param.whp_name:
+        raise ValueError(
+            f"{from_param} and {to_param} are not the same parameter in different units"
+        )
+    if from_param.reference_scale != to_param.reference_scale:
+        raise ValueError(
+            f"{from_param} and {to_param} have different reference scales "
+            f"({from_param.reference_scale} and {to_param.reference_scale})"
+        )
+    if from_param.cf_unit is None or to_param.cf_unit is None:
+        raise ValueError(f"{from_param} and {to_param} must both have a cf_unit")
+    return unit_conversion(from_param.cf_unit, to_param.cf_unit)